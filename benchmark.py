@@ -0,0 +1,116 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from project import CellTable, load_cell_table, get_closest_neighbor_distance, analyze_and_update_data, write_output
+
+SECTOR_CHOICES = [1, 2, 3, 4, 6, 9]                                                                 # Sectors per site, most sites have 3
+SECTOR_WEIGHTS = [0.05, 0.05, 0.7, 0.05, 0.1, 0.05]
+CITY_SPREAD = 0.05                                                                                  # Standard deviation of urban site positions around their city center, in degrees
+SITES_PER_CITY = 2000
+BASELINE_TOLERANCE = 0.25                                                                           # A stage slower than its baseline by more than 25% is a regression
+MINIMUM_SLOWDOWN = 0.01                                                                             # and by more than 10 ms, shorter differences are timer noise
+
+
+def generate_network(n_cells, seed=0, urban_fraction=0.6, area=(36.0, 41.0, -82.0, -74.0)):
+    rng = np.random.default_rng(seed)                                                               # Same seed gives the same network
+    south, north, west, east = area
+    sectors = rng.choice(SECTOR_CHOICES, size=n_cells, p=SECTOR_WEIGHTS)                             # More sites than needed, the extra sectors are cut below
+    sectors = sectors[:np.searchsorted(np.cumsum(sectors), n_cells) + 1]
+    n_sites = len(sectors)
+    urban = rng.random(n_sites) < urban_fraction
+    cities = np.column_stack([rng.uniform(south, north, max(1, n_sites // SITES_PER_CITY)), rng.uniform(west, east, max(1, n_sites // SITES_PER_CITY))])
+    city = cities[rng.integers(0, len(cities), n_sites)]
+    latitude = np.where(urban, city[:, 0] + rng.normal(0, CITY_SPREAD, n_sites), rng.uniform(south, north, n_sites)).round(6)
+    longitude = np.where(urban, city[:, 1] + rng.normal(0, CITY_SPREAD, n_sites), rng.uniform(west, east, n_sites)).round(6)
+    site = np.repeat(np.arange(n_sites), sectors)[:n_cells]
+    sector = np.arange(n_cells) - np.repeat(np.cumsum(sectors) - sectors, sectors)[:n_cells]        # Sector number inside its site
+    azimuth = (360 / sectors[site] * sector + rng.integers(0, 30, n_cells)) % 360                   # Sectors spread evenly around the site, turned a little
+    RRC_Att = rng.integers(1, 5000, n_cells)
+    RRC_Succ = rng.binomial(RRC_Att, rng.beta(20, 1, n_cells))
+    Timing_Advance = np.where(urban[site], rng.uniform(0.1, 3, n_cells), rng.uniform(1, 20, n_cells)).round(2)   # Urban cells serve a smaller area
+    tilt = rng.integers(0, 11, n_cells) * 10
+    return CellTable([f"CELL{i + 1}" for i in range(n_cells)], latitude[site], longitude[site], azimuth, RRC_Att, RRC_Succ, Timing_Advance, tilt)
+
+
+def write_network_csv(table, path):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(CellTable.FIELDS)
+        writer.writerows(zip(*[getattr(table, field).tolist() for field in CellTable.FIELDS]))
+
+
+def measure(function, memory=True):
+    if memory:
+        tracemalloc.start()                                                                         # numPy reports its arrays to tracemalloc too
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {"seconds": seconds, "peak_mb": peak / 2**20}
+
+
+def run_benchmark(sizes, seed=0, RRC_tresh=90, workers=1, memory=True):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for n_cells in sizes:
+            input_file = os.path.join(folder, f"network_{n_cells}.csv")
+            write_network_csv(generate_network(n_cells, seed), input_file)
+            stages = {}
+            table, stages["load_cell_table"] = measure(lambda: load_cell_table(input_file), memory)
+            neigh_dist, stages["get_closest_neighbor_distance"] = measure(lambda: get_closest_neighbor_distance(table, workers=workers), memory)
+            _, stages["analyze_and_update_data"] = measure(lambda: analyze_and_update_data(table, neigh_dist, RRC_tresh), memory)
+            _, stages["write_output"] = measure(lambda: write_output(table, os.path.join(folder, "output.csv")), memory)
+            results.append({"cells": n_cells, "stages": stages})
+    return results
+
+
+def compare(results, baseline, tolerance=BASELINE_TOLERANCE):
+    regressions = []
+    expected = {run["cells"]: run["stages"] for run in baseline}
+    for run in results:
+        for stage, numbers in run["stages"].items():
+            before = expected.get(run["cells"], {}).get(stage)
+            if before and numbers["seconds"] > max(before["seconds"] * (1 + tolerance), before["seconds"] + MINIMUM_SLOWDOWN):
+                regressions.append(f"{stage} with {run['cells']} cells: {numbers['seconds']:.3f}s, baseline {before['seconds']:.3f}s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times every stage of the optimizer on generated networks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="do not trace peak memory, tracing slows the Python loops down")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=BASELINE_TOLERANCE)
+    parser.add_argument("--save", help="JSON file to save this run in, to be used as a baseline later")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, args.seed, workers=args.workers, memory=not args.no_memory)
+    for run in results:
+        for stage, numbers in run["stages"].items():
+            print(f"{run['cells']:>9} cells  {stage:<30} {numbers['seconds']:>9.3f}s  {numbers['peak_mb']:>9.1f} MB")
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
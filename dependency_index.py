@@ -0,0 +1,199 @@
+import numpy as np
+from project import CellTable, SiteIndex, NEIGHBOR_BATCH, _bearing, _haversine, _in_front_distances, neighbor_search
+
+INDEX_VERSION = 1                                                                                   # Index files written with another version cannot be loaded
+REBUILD_SITES = 256                                                                                 # Sites added or removed since the tree was built, the site index and the tree are built again after this many
+
+
+class DependencyIndex:
+    def __init__(self, cells, k=NEIGHBOR_BATCH):
+        table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+        self.k = k
+        self.CellName = table.CellName.copy()
+        self.Latitude = table.Latitude.copy()
+        self.Longitude = table.Longitude.copy()
+        self.Azimuth = table.Azimuth.copy()
+        self.dist = np.full(len(table), np.nan)                                                     # Closest neighbor distance in front, 0 when there is none like get_closest_neighbor_distance, nan until searched
+        self._neighbor = [None] * len(table)                                                        # (Longitude, Latitude) of the neighbor site in front of every cell
+        self._dependents = {}                                                                       # Reverse index: neighbor site -> names of the cells it is the closest neighbor in front of
+        self._row_of_name = dict(zip(self.CellName.tolist(), range(len(table))))
+        if len(self._row_of_name) != len(table):
+            raise ValueError("CellName values should be unique")
+        self._build_sites()
+        self._search(np.arange(len(table)))
+
+    def __len__(self):
+        return len(self.CellName)
+
+    def dependents(self, name):                                                                     # Cells pointing at the site of the given cell
+        row = self._row(name)
+        return self.site_dependents(self.Latitude[row], self.Longitude[row])
+
+    def site_dependents(self, latitude, longitude):
+        return set(self._dependents.get((float(longitude), float(latitude)), ()))
+
+    def neighbor(self, name):                                                                       # (Latitude, Longitude, distance) of the neighbor site in front, None if there is none
+        row = self._row(name)
+        if self._neighbor[row] is None:
+            return None
+        longitude, latitude = self._neighbor[row]
+        return latitude, longitude, self.dist[row]
+
+    def neigh_dist(self):                                                                           # Same list of dictionaries as get_closest_neighbor_distance, for analyze_and_update_data
+        return [{"name": name, "dist": distance} for name, distance in zip(self.CellName.tolist(), self.dist.tolist())]
+
+    def insert_cells(self, cells):
+        table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+        for name in table.CellName.tolist():
+            if name in self._row_of_name:
+                raise ValueError(f"{name} is already in the index, please move or delete its site instead")
+        new_sites = {(longitude, latitude) for longitude, latitude in zip(table.Longitude.tolist(), table.Latitude.tolist())} - self._site_number.keys()
+        affected = [self._closer_in_front(longitude, latitude) for longitude, latitude in new_sites]   # Only a site that did not exist before can become someone's neighbor, a new sector of an existing site changes nothing for the others
+        first = len(self)
+        self.CellName = np.concatenate([self.CellName, table.CellName])
+        self.Latitude = np.concatenate([self.Latitude, table.Latitude])
+        self.Longitude = np.concatenate([self.Longitude, table.Longitude])
+        self.Azimuth = np.concatenate([self.Azimuth, table.Azimuth])
+        self.dist = np.concatenate([self.dist, np.full(len(table), np.nan)])
+        self._neighbor.extend([None] * len(table))
+        self._row_of_name.update(zip(table.CellName.tolist(), range(first, len(self))))
+        self._sites.site_of_cell = np.concatenate([self._sites.site_of_cell, [self._add_site(longitude, latitude) for longitude, latitude in zip(table.Longitude.tolist(), table.Latitude.tolist())]]).astype(int)
+        return self._search(np.union1d(np.concatenate(affected + [[]]), np.arange(first, len(self))).astype(int))
+
+    def move_site(self, latitude, longitude, new_latitude, new_longitude):
+        rows = self._site_rows(latitude, longitude)
+        dependents = self._dependent_rows(latitude, longitude)                                      # Cells that lose their neighbor
+        closer = self._closer_in_front(float(new_longitude), float(new_latitude))                   # Cells that may get the site at its new place as neighbor
+        self.Latitude[rows] = new_latitude
+        self.Longitude[rows] = new_longitude
+        self._remove_site(float(longitude), float(latitude))
+        self._sites.site_of_cell[rows] = [self._add_site(float(new_longitude), float(new_latitude)) for _ in rows.tolist()]
+        return self._search(np.union1d(np.union1d(rows, dependents), closer).astype(int))
+
+    def delete_site(self, latitude, longitude):
+        rows = self._site_rows(latitude, longitude)
+        for row in rows.tolist():
+            self._set_neighbor(row, None)
+        names = self.CellName[self._dependent_rows(latitude, longitude)].tolist()
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        self.CellName, self.Latitude, self.Longitude, self.Azimuth, self.dist = [column[keep] for column in (self.CellName, self.Latitude, self.Longitude, self.Azimuth, self.dist)]
+        self._neighbor = [neighbor for neighbor, kept in zip(self._neighbor, keep.tolist()) if kept]
+        self._row_of_name = dict(zip(self.CellName.tolist(), range(len(self))))
+        self._remove_site(float(longitude), float(latitude))
+        self._sites.site_of_cell = self._sites.site_of_cell[keep]
+        return self._search(np.array([self._row_of_name[name] for name in names], dtype=int))    # Only the cells which were pointing at the deleted site are searched again
+
+    def save(self, path):
+        neighbors = np.array([(np.nan, np.nan) if neighbor is None else neighbor for neighbor in self._neighbor], dtype=float).reshape(-1, 2)
+        with open(path, "wb") as file:
+            np.savez(file, version=INDEX_VERSION, k=self.k, CellName=self.CellName.astype(str), Latitude=self.Latitude, Longitude=self.Longitude,
+                     Azimuth=self.Azimuth, dist=self.dist, neighbor_longitude=neighbors[:, 0], neighbor_latitude=neighbors[:, 1])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            if int(saved["version"]) != INDEX_VERSION:
+                raise ValueError(f"{path} was written by another version of the index, please build it again")
+            index = cls.__new__(cls)                                                                # Nothing is searched, the saved neighbors are used
+            index.k = int(saved["k"])
+            index.CellName = saved["CellName"].astype(object)
+            index.Latitude, index.Longitude, index.Azimuth, index.dist = [saved[field] for field in ("Latitude", "Longitude", "Azimuth", "dist")]
+            neighbors = zip(saved["neighbor_longitude"].tolist(), saved["neighbor_latitude"].tolist())
+        index._neighbor = [None if np.isnan(longitude) else (longitude, latitude) for longitude, latitude in neighbors]
+        index._row_of_name = dict(zip(index.CellName.tolist(), range(len(index))))
+        index._dependents = {}
+        index._build_sites()
+        for name, neighbor in zip(index.CellName.tolist(), index._neighbor):
+            if neighbor is not None:
+                index._dependents.setdefault(neighbor, set()).add(name)
+        return index
+
+    def _row(self, name):
+        if name not in self._row_of_name:
+            raise ValueError(f"{name} is not a known cell")
+        return self._row_of_name[name]
+
+    def _build_sites(self):                                                                         # Site index and neighbor tree kept between the changes
+        self._sites = SiteIndex(self.Longitude, self.Latitude)
+        self._site_number = dict(zip(map(tuple, self._sites.coordinates.tolist()), range(len(self._sites))))
+        self._site_cells = np.bincount(self._sites.site_of_cell, minlength=len(self._sites))        # Sectors of every site, a site without any is removed
+        self._neighbors = _ResidentNeighbors(self._sites)
+
+    def _add_site(self, longitude, latitude):                                                       # Site number of a new sector, a new site is searched by brute force until the tree is built again
+        if (longitude, latitude) not in self._site_number:
+            self._site_number[(longitude, latitude)] = len(self._sites)
+            self._sites.coordinates = np.concatenate([self._sites.coordinates, [[longitude, latitude]]])
+            self._sites.radian_coordinates = np.concatenate([self._sites.radian_coordinates, np.radians([[longitude, latitude]])])
+            self._site_cells = np.concatenate([self._site_cells, [0]])
+        site = self._site_number[(longitude, latitude)]
+        self._site_cells[site] += 1
+        return site
+
+    def _remove_site(self, longitude, latitude):
+        site = self._site_number.pop((longitude, latitude))
+        self._sites.coordinates[site] = np.nan                                                      # nan fails the azimuth comparison, a removed site is never a neighbor
+        self._sites.radian_coordinates[site] = np.nan
+        self._site_cells[site] = 0
+
+    def _site_rows(self, latitude, longitude):
+        rows = np.flatnonzero((self.Latitude == latitude) & (self.Longitude == longitude))
+        if len(rows) == 0:
+            raise ValueError(f"There is no site at Latitude {latitude}, Longitude {longitude}")
+        return rows
+
+    def _dependent_rows(self, latitude, longitude):
+        return np.array([self._row_of_name[name] for name in self.site_dependents(latitude, longitude)], dtype=int)
+
+    def _closer_in_front(self, longitude, latitude):                                                # Cells for which a site at this place would be in front and not farther than their neighbor
+        point = np.radians([longitude, latitude])
+        rows = np.flatnonzero((self.dist == 0) | (np.abs(np.radians(self.Longitude) - point[0]) * 6371 <= self.dist + 1e-6))   # The haversine distance is never shorter than the difference of its first coordinate, the others are too far
+        sources = np.radians(np.column_stack([self.Longitude[rows], self.Latitude[rows]]))
+        distance = _haversine(sources, point[None, :]) * 6371                                       # Same calculation as the neighbor search, so equal distances are found equal
+        difference = np.abs(_bearing(sources[:, 1], sources[:, 0], point[1], point[0]) - self.Azimuth[rows])
+        in_front = np.minimum(difference, 360 - difference) <= 60
+        return rows[in_front & ((self.dist[rows] == 0) | (distance <= self.dist[rows]))]
+
+    def _search(self, rows):                                                                        # Searches the given cells again, returns {name: distance} of the cells whose distance changed
+        if len(rows) == 0:
+            return {}
+        if len(self._sites) - self._neighbors.tree_sites + np.count_nonzero(self._site_cells[:self._neighbors.tree_sites] == 0) > REBUILD_SITES:
+            self._build_sites()
+        sites = self._sites
+        distances, neighbor_sites = _in_front_distances(sites, self.Azimuth, rows, self.k, return_sites=True, nbrs=self._neighbors)
+        changed = {}
+        for row, distance, site in zip(rows.tolist(), distances.tolist(), neighbor_sites.tolist()):
+            if distance != self.dist[row]:                                                          # nan of a new cell is never equal
+                changed[self.CellName[row]] = distance
+            self.dist[row] = distance
+            self._set_neighbor(row, None if site < 0 else tuple(sites.coordinates[site].tolist()))
+        return changed
+
+    def _set_neighbor(self, row, neighbor):
+        old = self._neighbor[row]
+        if old is not None:
+            self._dependents[old].discard(self.CellName[row])
+            if not self._dependents[old]:
+                del self._dependents[old]
+        if neighbor is not None:
+            self._dependents.setdefault(neighbor, set()).add(self.CellName[row])
+        self._neighbor[row] = neighbor
+
+
+class _ResidentNeighbors:                                                                           # kneighbors over the sites of the tree and the sites added after it, removed sites are skipped
+    def __init__(self, sites):
+        self.sites = sites
+        self.tree_sites = len(sites)
+        self.tree = neighbor_search(sites.radian_coordinates)
+
+    def kneighbors(self, X, n_neighbors):                                                           # Same result as a tree built over the current sites, removed sites come last with an infinite distance
+        radian_coordinates = self.sites.radian_coordinates
+        removed = np.flatnonzero(np.isnan(radian_coordinates[:self.tree_sites, 0]))
+        distances, indices = self.tree.kneighbors(X, n_neighbors=min(n_neighbors + len(removed), self.tree_sites))
+        added = radian_coordinates[self.tree_sites:]
+        if len(added):
+            distances = np.concatenate([distances, _haversine(X[:, None, :], added[None, :, :])], axis=1)   # Same haversine as the tree, equal distances are found equal
+            indices = np.concatenate([indices, np.broadcast_to(np.arange(self.tree_sites, len(radian_coordinates)), (len(X), len(added)))], axis=1)
+        distances = np.where(np.isnan(radian_coordinates[indices, 0]), np.inf, distances)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :n_neighbors]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
@@ -0,0 +1,175 @@
+import argparse
+import json
+import math
+import sys
+import time
+import warnings
+import numpy as np
+from project import CellTable, SiteIndex, NEIGHBOR_QUERY_BUDGET, load_cell_table, tilt_decision_kernel, _bearing, _haversine, _in_front_distances, _threshold_argument
+
+EARTH_RADIUS_KM = 6371
+APPROXIMATION_KM = 0.5                                                                              # Default error bound, a reported distance is at most this much longer than the exact one
+SITES_PER_BUCKET = 0.5                                                                              # Average number of sites per grid bucket when the bucket size is not given
+MAX_RINGS = 6                                                                                       # Rings of buckets searched around a cell before going to larger buckets
+LEVEL_FACTOR = 4
+MAX_GRID_DEGREES = 80                                                                               # Networks reaching further than this from their middle (after the rotation) are searched exactly
+
+
+def get_approximate_neighbor_distance(cells, error_km=APPROXIMATION_KM, grid_km=None):
+    table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+    sites = SiteIndex(table.Longitude, table.Latitude)
+    distances = approximate_in_front_distances(sites, table.Azimuth, error_km, grid_km)
+    return [{"name": name, "dist": distance} for name, distance in zip(table.CellName.tolist(), distances.tolist())]
+
+
+def approximate_in_front_distances(sites, azimuths, error_km=APPROXIMATION_KM, grid_km=None):
+    if error_km < 0:
+        raise ValueError("error_km cannot be less than 0")
+    if grid_km is not None and grid_km <= 0:
+        raise ValueError("grid_km should be greater than 0")
+    azimuths = np.asarray(azimuths, dtype=float)
+    if len(sites) < 2:
+        return _in_front_distances(sites, azimuths, np.arange(len(azimuths)))
+    first, second = _rotated_coordinates(sites)
+    if np.abs(first).max() >= MAX_GRID_DEGREES or np.ptp(second) >= 2 * MAX_GRID_DEGREES:
+        warnings.warn("The network covers too much of the globe for the grid search, the exact search is used", RuntimeWarning)
+        return _in_front_distances(sites, azimuths, np.arange(len(azimuths)))
+    grid_km = grid_km or _grid_size(first, second, len(sites))
+    best = np.full(len(azimuths), np.inf)
+    pending = np.arange(len(azimuths))
+    while len(pending):                                                                             # Cells not done in MAX_RINGS rings go on with buckets LEVEL_FACTOR times larger, like a shorter geohash
+        grid = _Grid(sites, first, second, grid_km)
+        for ring in range(MAX_RINGS + 1):
+            chunk_size = max(1, NEIGHBOR_QUERY_BUDGET // (8 * ring or 1))                           # Cells x buckets of the ring held in memory at once
+            for chunk_start in range(0, len(pending), chunk_size):
+                for cells, candidates in grid.candidates(pending[chunk_start:chunk_start + chunk_size], ring, azimuths):   # Only the buckets of this ring which can be inside the ±60° azimuth wedge of the cell
+                    _search_block(sites, azimuths, cells, candidates, best)
+            pending = pending[best[pending] > grid.unseen_distance(ring) + error_km]               # A site not seen yet is farther than unseen_distance, the cells closer than that (plus the error bound) are done
+            if len(pending) == 0:
+                break
+        grid_km *= LEVEL_FACTOR
+    minimum_distances = np.zeros(len(azimuths))                                                     # Distance stays 0 for the cells without any neighbor in front, as in the exact search
+    found = np.isfinite(best)
+    minimum_distances[found] = best[found]
+    return minimum_distances
+
+
+def _search_block(sites, azimuths, cells, candidates, best):
+    source = sites.radian_coordinates[sites.site_of_cell[cells]]
+    neighbor = sites.radian_coordinates[candidates]
+    bearing = _bearing(source[:, 1], source[:, 0], neighbor[:, 1], neighbor[:, 0])
+    difference = np.abs(bearing - azimuths[cells])
+    in_front = (np.minimum(difference, 360 - difference) <= 60) & (candidates != sites.site_of_cell[cells])   # The cell's own site is never a neighbor
+    np.minimum.at(best, cells[in_front], _haversine(source[in_front], neighbor[in_front]) * EARTH_RADIUS_KM)   # Same haversine as the exact search, so found distances are exactly the same
+
+
+def _rotated_coordinates(sites):
+    first, second = sites.radian_coordinates[:, 0], sites.radian_coordinates[:, 1]                 # The haversine distance is given [Longitude, Latitude], so it is the angle between these points of the unit sphere
+    points = np.column_stack([np.cos(first) * np.cos(second), np.cos(first) * np.sin(second), np.sin(first)])
+    center = points.mean(axis=0)
+    if np.linalg.norm(center) < 1e-6:
+        return np.full(len(points), 90.0), np.zeros(len(points))                                   # Sites all around the sphere, no grid
+    center /= np.linalg.norm(center)
+    up = np.array([0.0, 0.0, 1.0]) if abs(center[2]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    up -= up.dot(center) * center
+    up /= np.linalg.norm(up)
+    rotated = points @ np.column_stack([center, np.cross(center, up), up])                         # Rotation moves the middle of the network to (0, 0), where buckets are nearly square, angles between points do not change
+    return np.degrees(np.arcsin(np.clip(rotated[:, 2], -1, 1))), np.degrees(np.arctan2(rotated[:, 1], rotated[:, 0]))
+
+
+def _grid_size(first, second, n_sites):
+    height = np.ptp(first) * math.pi / 180 * EARTH_RADIUS_KM
+    width = np.ptp(second) * math.pi / 180 * EARTH_RADIUS_KM * math.cos(math.radians(float(np.abs(first).max())))
+    return math.sqrt(max(height * width, 1.0) * SITES_PER_BUCKET / n_sites)                        # Finest bucket size from the average site density
+
+
+class _Grid:                                                                                        # Buckets of about grid_km x grid_km, like geohash cells
+    def __init__(self, sites, first, second, grid_km):                                              # first and second are the rotated coordinates of the sites, in degrees
+        self.max_first = float(np.abs(first).max())
+        self.grid_km = grid_km
+        self.height = math.degrees(grid_km / EARTH_RADIUS_KM)                                       # Bucket size in degrees along the first coordinate
+        self.width = self.height / math.cos(math.radians(self.max_first))                           # Wider in degrees along the second one, so no bucket is shorter than grid_km
+        row = np.floor((first - first.min()) / self.height).astype(np.int64) + MAX_RINGS           # Margin of MAX_RINGS buckets on every side, so ring keys never wrap around
+        column = np.floor((second - second.min()) / self.width).astype(np.int64) + MAX_RINGS
+        self.stride = int(column.max()) + MAX_RINGS + 1
+        self.span = max(int(row.max() - row.min()), int(column.max() - column.min()))              # After this many rings every bucket has been searched
+        self.site_key = row * self.stride + column
+        self.order = np.argsort(self.site_key, kind="stable")                                       # Site numbers sorted by bucket
+        self.keys, self.bucket_start, self.counts = np.unique(self.site_key[self.order], return_index=True, return_counts=True)
+        self.sites = sites
+        ground = sites.radian_coordinates[self.order][:, ::-1]                                      # [Latitude, Longitude] of the sites on the ground, for the azimuth wedge
+        self.center = np.add.reduceat(ground, self.bucket_start) / self.counts[:, None]
+        self.radius = np.maximum.reduceat(_haversine(ground, np.repeat(self.center, self.counts, axis=0)), self.bucket_start) * EARTH_RADIUS_KM   # Every site of the bucket is within radius of its center on the ground
+
+    def unseen_distance(self, ring):                                                                # Shortest distance from a cell to a site outside the buckets searched up to this ring
+        if ring >= self.span:
+            return np.inf
+        along_second = 2 * EARTH_RADIUS_KM * math.asin(math.cos(math.radians(self.max_first)) * math.sin(math.radians(ring * self.width) / 2))
+        return min(ring * self.grid_km, along_second) - 1e-9                                        # A little shorter for the rounding of the rotation
+
+    def candidates(self, cells, ring, azimuths):                                                   # Yields (cell, candidate site) pairs in blocks of about NEIGHBOR_QUERY_BUDGET pairs
+        offsets = np.array([(dy, dx) for dy in range(-ring, ring + 1) for dx in range(-ring, ring + 1) if max(abs(dy), abs(dx)) == ring])
+        site_of_cell = self.sites.site_of_cell[cells]
+        keys = self.site_key[site_of_cell][:, None] + offsets[:, 0] * self.stride + offsets[:, 1]  # (cells x buckets of the ring)
+        position = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[position] == keys
+        if ring > 1:
+            found &= self._in_wedge(site_of_cell, position, azimuths[cells])                        # Buckets outside the wedge are skipped, the nearest rings are always searched
+        counts = np.where(found, self.counts[position], 0)
+        total = np.cumsum(counts.sum(axis=1))
+        bounds = np.unique(np.searchsorted(total, np.arange(0, total[-1], NEIGHBOR_QUERY_BUDGET), side="right"))
+        for low, high in zip(bounds.tolist(), bounds[1:].tolist() + [len(cells)]):
+            block_counts = counts[low:high].reshape(-1)
+            pairs = np.repeat(np.arange(block_counts.size), block_counts)
+            start = np.repeat(self.bucket_start[position[low:high].reshape(-1)] - np.cumsum(block_counts) + block_counts, block_counts)
+            yield cells[low:high][pairs // len(offsets)], self.order[start + np.arange(len(pairs))]   # Every site of every kept bucket
+
+    def _in_wedge(self, site_of_cell, position, azimuths):
+        source = self.sites.radian_coordinates[site_of_cell][:, None, ::-1]                         # [Latitude, Longitude] of the cell's site
+        center = self.center[position]
+        distance = _haversine(source, center) * EARTH_RADIUS_KM
+        radius = self.radius[position]
+        slack = np.degrees(np.arcsin(np.minimum(1, radius / np.maximum(distance, 1e-12)))) + 1     # Any site of the bucket can be in the wedge, one more degree for the curvature
+        difference = np.abs(_bearing(source[..., 0], source[..., 1], center[..., 0], center[..., 1]) - azimuths[:, None])
+        return (np.minimum(difference, 360 - difference) <= 60 + slack) | (distance <= radius)     # A bucket around the cell can be in any direction
+
+
+def compare_with_exact(cells, RRC_tresh, error_km=APPROXIMATION_KM, grid_km=None):
+    table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+    sites = SiteIndex(table.Longitude, table.Latitude)
+    start = time.perf_counter()
+    exact = _in_front_distances(sites, table.Azimuth, np.arange(len(table)))
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    approximate = approximate_in_front_distances(sites, table.Azimuth, error_km, grid_km)
+    approximate_seconds = time.perf_counter() - start
+    decisions = [tilt_decision_kernel(table.RRC_Att, table.RRC_Succ, table.Timing_Advance, table.tilt, dist, RRC_tresh) for dist in (exact, approximate)]
+    return {
+        "cells": len(table),
+        "error_km": error_km,
+        "different_distances": int((exact != approximate).sum()),
+        "max_difference_km": float(np.abs(exact - approximate).max()) if len(table) else 0.0,
+        "different_decisions": int(((decisions[0][0] != decisions[1][0]) | (decisions[0][1] != decisions[1][1])).sum()),   # New tilt or state is not the same as with the exact distances
+        "exact_seconds": exact_seconds,
+        "approximate_seconds": approximate_seconds,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares the approximate grid neighbor search with the exact search on an input file")
+    parser.add_argument("input", help="cell inventory csv file")
+    parser.add_argument("-t", "--threshold", type=_threshold_argument, required=True, help="RRC Success Rate Percentage Threshold, between 0 and 100")
+    parser.add_argument("--error-km", type=float, default=APPROXIMATION_KM, help=f"error bound of the approximate distances (default: {APPROXIMATION_KM})")
+    parser.add_argument("--grid-km", type=float, help="bucket size, by default from the average site density")
+    args = parser.parse_args(argv)
+    try:
+        report = compare_with_exact(load_cell_table(args.input), args.threshold, args.error_km, args.grid_km)
+    except (OSError, ValueError) as error:
+        print(f"Could not compare {args.input}: {error}", file=sys.stderr)
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
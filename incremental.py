@@ -0,0 +1,80 @@
+import csv
+import os
+import numpy as np
+from project import CellTable, analyze_and_update_data, tilt_decision_kernel, write_output, _invalid_rows
+
+KPI_FIELDS = ["CellName","RRC_Att","RRC_Succ","Timing_Advance"]
+
+
+class IncrementalOptimizer:
+    def __init__(self, path):
+        self.path = path                                                                            # .npz file holding the last analyzed tilt, state and neighbor distance of every cell
+
+    def start(self, cells, neigh_dist, RRC_tresh):
+        table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+        analyze_and_update_data(table, neigh_dist, RRC_tresh)                                       # First run analyzes every cell, like main()
+        distances = {dist["name"]: dist["dist"] for dist in neigh_dist}
+        self._save(table, np.array([distances.get(name, np.nan) for name in table.CellName.tolist()]))
+        return table
+
+    def apply_delta(self, delta_source, RRC_tresh, output=None):
+        table, dist = self._load()
+        rows, RRC_Att, RRC_Succ, Timing_Advance = _read_delta(delta_source, table)
+        changed = apply_kpis(table, dist, rows, RRC_Att, RRC_Succ, Timing_Advance, RRC_tresh)
+        self._save(table, dist)
+        changed_rows = table.take(changed)
+        if output is not None:
+            write_output(changed_rows, output)                                                      # Only the changed rows, in the save_output_data column layout
+        return changed_rows
+
+    def _save(self, table, dist):
+        columns = {field: getattr(table, field) for field in CellTable.FIELDS}
+        columns["CellName"] = table.CellName.astype(str)
+        with open(self.path, "wb") as file:
+            np.savez(file, state=table.state, dist=dist, **columns)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Could not read {self.path}, please run start first")
+        with np.load(self.path) as saved:
+            table = CellTable(*[saved[field] for field in CellTable.FIELDS], state=saved["state"])
+            table.CellName = table.CellName.astype(object)
+            return table, saved["dist"]
+
+
+def apply_kpis(table, dist, rows, RRC_Att, RRC_Succ, Timing_Advance, RRC_tresh):
+    for invalid, message in _invalid_rows(RRC_Att, RRC_Succ, Timing_Advance, table.tilt[rows]):
+        if invalid.any():                                                                           # Same validation rules as a full input file, nothing is changed for a bad delta
+            raise ValueError(f"{table.CellName[rows[np.argmax(invalid)]]}: {message}")
+    table.RRC_Att[rows] = RRC_Att
+    table.RRC_Succ[rows] = RRC_Succ
+    table.Timing_Advance[rows] = Timing_Advance
+    new_tilt, state = tilt_decision_kernel(RRC_Att, RRC_Succ, Timing_Advance, table.tilt[rows], dist[rows], RRC_tresh)   # Only the reported cells are analyzed again
+    changed = rows[(new_tilt != table.tilt[rows]) | (state != table.state[rows])]
+    table.tilt[rows] = new_tilt
+    table.state[rows] = state
+    return changed
+
+
+def _read_delta(source, table):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="") as file:
+            return _read_delta(file, table)
+    row_of_name = dict(zip(table.CellName.tolist(), range(len(table))))
+    latest = {}
+    reader = csv.DictReader(source)
+    for row in reader:
+        if any(row.get(field) in (None, "") for field in KPI_FIELDS):                               # Short rows leave the missing fields None
+            raise ValueError(f"line {reader.line_num}: {','.join(KPI_FIELDS)} values should all be given")
+        if row["CellName"] not in row_of_name:
+            raise ValueError(f"{row['CellName']} is not a known cell, please run start with the new inventory")
+        try:
+            latest[row_of_name[row["CellName"]]] = (int(row["RRC_Att"]), int(row["RRC_Succ"]), float(row["Timing_Advance"]))   # A cell reported twice keeps its last row
+        except ValueError as error:
+            raise ValueError(f"line {reader.line_num}: {error}") from error
+    rows = np.array(sorted(latest), dtype=int)
+    values = [latest[row] for row in rows.tolist()]
+    RRC_Att = np.array([value[0] for value in values], dtype=np.int64)
+    RRC_Succ = np.array([value[1] for value in values], dtype=np.int64)
+    Timing_Advance = np.array([value[2] for value in values], dtype=float)
+    return rows, RRC_Att, RRC_Succ, Timing_Advance
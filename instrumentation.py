@@ -0,0 +1,99 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource                                                                                 # Not available on Windows, peak RSS is left empty there
+except ImportError:
+    resource = None
+
+PROFILERS = ["cprofile", "tracemalloc"]
+VALUE_FIELDS = ["rows", "wall_seconds", "cpu_seconds", "peak_rss_bytes", "rows_per_second", "traced_peak_bytes"]
+PROMETHEUS_METRICS = [
+    ("wall_seconds", "Wall clock time of the stage"),
+    ("cpu_seconds", "CPU time of the process during the stage"),
+    ("peak_rss_bytes", "Peak resident memory of the process at the end of the stage"),
+    ("rows", "Number of cells handled by the stage"),
+    ("rows_per_second", "Cells handled per wall clock second"),
+]
+
+
+class Instrumentation:
+    def __init__(self, enabled=True, profile=None, profile_dir="."):
+        self.enabled = enabled
+        self.profile = profile or {}                                                                # Stage name to "cprofile" or "tracemalloc", only these stages are profiled
+        self.profile_dir = profile_dir
+        self.stages = []
+        for name, profiler in self.profile.items():
+            if profiler not in PROFILERS:
+                raise ValueError(f"Unknown profiler {profiler} for {name}, please select cprofile or tracemalloc")
+
+    @contextmanager
+    def stage(self, name, rows=None, **labels):
+        record = {"stage": name, "rows": rows, **labels}                                            # Caller can set record["rows"] when the number of rows is known only at the end, labels tell runs of the same stage apart
+        if not self.enabled:
+            yield record
+            return
+        profiler = self.profile.get(name)
+        profile_name = name
+        if "input" in labels:                                                                       # One profile per input file in batch mode, <input name>_<stage> like the output files
+            profile_name = f"{os.path.splitext(os.path.basename(str(labels['input'])))[0]}_{name}"
+        if profiler == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+        elif profiler == "tracemalloc":
+            tracemalloc.start()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = time.perf_counter() - wall
+            record["cpu_seconds"] = time.process_time() - cpu
+            record["peak_rss_bytes"] = _peak_rss()
+            if profiler == "cprofile":
+                profile.disable()
+                profile.dump_stats(os.path.join(self.profile_dir, f"{profile_name}.prof"))
+            elif profiler == "tracemalloc":
+                record["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                top = tracemalloc.take_snapshot().statistics("lineno")[:20]
+                tracemalloc.stop()
+                with open(os.path.join(self.profile_dir, f"{profile_name}.tracemalloc.txt"), "w") as file:
+                    file.writelines(f"{line}\n" for line in top)
+            record["rows_per_second"] = record["rows"] / record["wall_seconds"] if record["rows"] and record["wall_seconds"] else None
+            self.stages.append(record)
+
+    def to_json(self):
+        return json.dumps({"stages": self.stages}, indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        for metric, description in PROMETHEUS_METRICS:
+            lines.append(f"# HELP optimizer_stage_{metric} {description}")
+            lines.append(f"# TYPE optimizer_stage_{metric} gauge")
+            for record in self.stages:
+                if record.get(metric) is not None:
+                    labels = ",".join(f'{key}="{_escape(value)}"' for key, value in record.items() if key not in VALUE_FIELDS)
+                    lines.append(f"optimizer_stage_{metric}{{{labels}}} {record[metric]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        text = self.to_prometheus() if str(path).endswith(".prom") else self.to_json()               # .prom files are for the node exporter textfile collector, anything else gets JSON
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(text)
+        os.replace(temporary, path)                                                                 # Readers never see a half written file
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")          # Label value escaping of the Prometheus text format
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024                                 # Linux reports kilobytes, macOS bytes
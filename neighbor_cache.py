@@ -0,0 +1,71 @@
+import os
+import numpy as np
+from project import CellTable, SiteIndex, NEIGHBOR_BATCH, geometry_keys, neighbor_search, _in_front_distances
+
+CACHE_VERSION = 1                                                                                   # Caches written with another version are rebuilt from scratch
+REBUILD_FRACTION = 0.5                                                                              # When more than this part of the cells need a new search, everything is searched again
+
+
+class NeighborCache:
+    def __init__(self, path, rebuild_fraction=REBUILD_FRACTION):
+        self.path = path
+        self.rebuild_fraction = rebuild_fraction
+        self.recomputed = 0                                                                         # Number of cells searched again by the last call
+        self.full_rebuild = False
+
+    def get_closest_neighbor_distance(self, cells, k=NEIGHBOR_BATCH, vectorized=True):
+        table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+        keys = geometry_keys(table)
+        sites = SiteIndex(table.Longitude, table.Latitude)
+        cached = self._load()
+        dirty = None if cached is None else self._dirty_cells(table, keys, sites, cached)
+        if dirty is None or len(dirty) > self.rebuild_fraction * len(table):                       # Missing or stale cache, or too much has changed: full search
+            self.full_rebuild = True
+            distances = _in_front_distances(sites, table.Azimuth, np.arange(len(table)), k, vectorized)
+        else:
+            self.full_rebuild = False
+            distances = self._cached_distances(keys, cached)
+            distances[dirty] = _in_front_distances(sites, table.Azimuth, dirty, k, vectorized)    # Only the cells whose own or nearby geometry changed are searched again
+        self.recomputed = len(table) if self.full_rebuild else len(dirty)
+        self._save(table, keys, distances)
+        return [{"name": name, "dist": distance} for name, distance in zip(table.CellName.tolist(), distances.tolist())]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path) as cache:
+            if int(cache["version"]) != CACHE_VERSION:
+                return None
+            return {name: cache[name] for name in cache.files}
+
+    def _save(self, table, keys, distances):
+        with open(self.path, "wb") as file:
+            np.savez(file, version=CACHE_VERSION, keys=keys, Longitude=table.Longitude, Latitude=table.Latitude, dist=distances)
+
+    def _cached_distances(self, keys, cached):
+        row_of_key = dict(zip(cached["keys"].tolist(), range(len(cached["keys"]))))
+        rows = np.array([row_of_key.get(key, -1) for key in keys.tolist()], dtype=int)
+        return np.where(rows >= 0, cached["dist"][rows], 0.0)
+
+    def _dirty_cells(self, table, keys, sites, cached):
+        known = np.isin(keys, cached["keys"])                                                       # Cells added, renamed, moved or turned since the last run are always searched again
+        old_sites = SiteIndex(cached["Longitude"], cached["Latitude"]).coordinates
+        added = _missing_rows(sites.coordinates, old_sites)                                         # Site positions that appeared, a moved site appears here with its new position
+        removed = _missing_rows(old_sites, sites.coordinates)                                       # and here with its old one
+        changed = np.concatenate([added, removed])
+        distances = self._cached_distances(keys, cached)
+        dirty = ~known
+        if len(changed):
+            nearest, _ = neighbor_search(np.radians(changed)).kneighbors(sites.radian_coordinates[sites.site_of_cell], n_neighbors=1)
+            dirty |= nearest[:, 0] * 6371 <= distances + 1e-9                                       # A changed site closer than the cached neighbor can replace it, or was the neighbor itself
+            if len(added):
+                dirty |= distances == 0                                                             # A new site may give a neighbor in front to cells which had none
+        return np.flatnonzero(dirty)
+
+
+def _missing_rows(coordinates, other):
+    if len(other) == 0:
+        return coordinates
+    merged = np.concatenate([other, coordinates])
+    _, first, counts = np.unique(merged, axis=0, return_index=True, return_counts=True)
+    return merged[first[(counts == 1) & (first >= len(other))]]                                   # Rows of coordinates that do not appear in other
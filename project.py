@@ -1,10 +1,54 @@
+import argparse
 import csv
+import glob
 import re
+import os
+import sys
 import math
-import numpy as np
-from sklearn.neighbors import NearestNeighbors
+import numbers
+import itertools
+import hashlib
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from enum import IntEnum
+from instrumentation import PROFILERS, Instrumentation
+
+
+class _LazyModule:                                                                                  # Imports the module at the first attribute access and takes its place in this module
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attribute)
+
+
+np = _LazyModule("numpy", "np")                                                                     # Validation only callers (Cell, get_RRC_threshold) never import numPy
+
+STATES = ["No action","Overshooter, cell downtilted 20 degrees","Undershooter, cell uptilted 20 degrees",
+          "Overshooter, cell downtilted less than 20 degrees","Undershooter, cell uptilted less than 20 degrees",
+          "Tilt value cannot be increased further","Tilt value cannot be decreased further"]
+
+
+class State(IntEnum):                                                                               # Integer code of every state, STATES[code] is the text written to the output
+    NO_ACTION = 0
+    OVERSHOOTER_DOWNTILTED = 1
+    UNDERSHOOTER_UPTILTED = 2
+    OVERSHOOTER_DOWNTILTED_LESS = 3
+    UNDERSHOOTER_UPTILTED_LESS = 4
+    TILT_CANNOT_BE_INCREASED = 5
+    TILT_CANNOT_BE_DECREASED = 6
+
+
+STATE_CODES = {name: code for code, name in enumerate(STATES)}
+
 
 class Cell:
+    __slots__ = ("CellName","_Latitude","_Longitude","Azimuth","_RRC_Att","_RRC_Succ","_Timing_Advance","_tilt","_state")   # No per instance __dict__, the values sit in fixed slots
+
     def __init__(self,CellName,Latitude,Longitude,Azimuth,RRC_Att,RRC_Succ,Timing_Advance,tilt):
         self.CellName = CellName
         self.Latitude = Latitude
@@ -14,36 +58,44 @@ class Cell:
         self.RRC_Succ = RRC_Succ
         self.Timing_Advance = Timing_Advance
         self.tilt = tilt
-        self.state = "No action"
-
+        self._state = State.NO_ACTION
+
+    @classmethod
+    def from_validated(cls,CellName,Latitude,Longitude,Azimuth,RRC_Att,RRC_Succ,Timing_Advance,tilt,state=State.NO_ACTION):
+        cell = cls.__new__(cls)                                                                     # Trusted construction for loaders which already converted and validated whole columns, the setters are skipped
+        cell.CellName = CellName
+        cell._Latitude = Latitude
+        cell._Longitude = Longitude
+        cell.Azimuth = Azimuth
+        cell._RRC_Att = RRC_Att
+        cell._RRC_Succ = RRC_Succ
+        cell._Timing_Advance = Timing_Advance
+        cell._tilt = tilt
+        cell._state = state
+        return cell
 
     def __str__(self):
-        return f"{self.CellName}'s state is {self._state}, and its tilt value is {self.tilt}"
+        return f"{self.CellName}'s state is {self.state}, and its tilt value is {self.tilt}"
 
     def __eq__(self, compared):                                                                     # for the test purpose, when comparing two instances, it compares their values
         return (
-            self.CellName == compared.CellName and
-            self.Latitude == compared.Latitude and
-            self.Longitude == compared.Longitude and
-            self.RRC_Att == compared.RRC_Att and
-            self.RRC_Succ == compared.RRC_Succ and
-            self.Timing_Advance == compared.Timing_Advance and
-            self.tilt == compared.tilt
+            (self.CellName, self._Latitude, self._Longitude, self._RRC_Att, self._RRC_Succ, self._Timing_Advance, self._tilt) ==
+            (compared.CellName, compared.Latitude, compared.Longitude, compared.RRC_Att, compared.RRC_Succ, compared.Timing_Advance, compared.tilt)
         )
 
     def uptilt(self):
-        if self.tilt < 20:
-            self.tilt = 0
+        if self._tilt < 20:                                                                         # Result always stays between 0 and 100, so the tilt setter is not needed
+            self._tilt = 0
         else:
-            self.tilt -= 20
-        return self.tilt
+            self._tilt -= 20
+        return self._tilt
 
     def downtilt(self):
-        if self.tilt > 80:
-            self.tilt = 100
+        if self._tilt > 80:
+            self._tilt = 100
         else:
-            self.tilt += 20
-        return self.tilt
+            self._tilt += 20
+        return self._tilt
 
     @property
     def Latitude(self):
@@ -113,14 +165,22 @@ class Cell:
 
     @property
     def state(self):
+        return STATES[self._state]
+
+    @property
+    def state_code(self):
         return self._state
 
     @state.setter
     def state(self,new_state):
-        if new_state in ["No action","Overshooter, cell downtilted 20 degrees","Undershooter, cell uptilted 20 degrees",
-                         "Overshooter, cell downtilted less than 20 degrees","Undershooter, cell uptilted less than 20 degrees",
-                         "Tilt value cannot be increased further","Tilt value cannot be decreased further"]:
-            self._state = new_state
+        if isinstance(new_state, str):
+            code = STATE_CODES.get(new_state)                                                       # Dictionary lookup instead of searching the state list
+        elif isinstance(new_state, numbers.Integral) and not isinstance(new_state, bool):
+            code = int(new_state) if new_state in STATE_CODES.values() else None                    # A State code can be given directly, numPy codes of CellTable.state as well, True or 1.0 are not codes
+        else:
+            code = None
+        if code is not None:
+            self._state = State(code)
         else:
             raise ValueError("Please select a defined state: " \
             "No action, " \
@@ -133,14 +193,203 @@ class Cell:
             "Tilt value cannot be decreased further")
 
 
-def main():
+class CellTable:
+    FIELDS = ["CellName","Latitude","Longitude","Azimuth","RRC_Att","RRC_Succ","Timing_Advance","tilt"]
+
+    def __init__(self,CellName,Latitude,Longitude,Azimuth,RRC_Att,RRC_Succ,Timing_Advance,tilt,state=None,validate=True):
+        self.CellName = np.asarray(CellName, dtype=object)                                         # One numPy array per field instead of one Cell object per row
+        self.Latitude = np.asarray(Latitude, dtype=float)
+        self.Longitude = np.asarray(Longitude, dtype=float)
+        self.Azimuth = np.asarray(Azimuth, dtype=float)
+        self.RRC_Att = np.asarray(RRC_Att).astype(np.int64, copy=False)                             # Arrays of the right type are used as they are, memory mapped columns are not copied
+        self.RRC_Succ = np.asarray(RRC_Succ).astype(np.int64, copy=False)
+        self.Timing_Advance = np.asarray(Timing_Advance, dtype=float)
+        self.tilt = np.asarray(tilt).astype(np.int64, copy=False)
+        if state is None:
+            state = np.full(len(self.CellName), State.NO_ACTION)
+        elif len(state) and isinstance(state[0], str):
+            state = [STATES.index(name) for name in state]
+        self.state = np.asarray(state).astype(np.int8, copy=False)                                  # State codes, turned into the state texts only at output time
+        if validate:
+            self.validate()
+
+    def __len__(self):
+        return len(self.CellName)
+
+    def __getitem__(self, i):                                                                       # Existing callers still get a Cell for a single row, a read-only snapshot: changing it does not change the table
+        return Cell.from_validated(*[np.asarray(getattr(self, field)[i]).item() for field in self.FIELDS], state=State(self.state[i]))   # CellName items are already Python strings
+
+    def __iter__(self):
+        columns = [getattr(self, field).tolist() for field in self.FIELDS]                          # Rows are already validated, Cells are built without the setters, snapshots like table[i]
+        states = list(State)
+        for CellName,Latitude,Longitude,Azimuth,RRC_Att,RRC_Succ,Timing_Advance,tilt,state in zip(*columns, self.state.tolist()):
+            yield Cell.from_validated(CellName,Latitude,Longitude,Azimuth,RRC_Att,RRC_Succ,Timing_Advance,tilt,states[state])
+
+    def state_names(self):
+        return [STATES[code] for code in self.state.tolist()]
+
+    def take(self, rows):                                                                           # New table with the given rows only
+        return CellTable(*[getattr(self, field)[rows] for field in self.FIELDS], state=self.state[rows])
+
+    def validate(self):
+        for invalid, message in _invalid_rows(self.RRC_Att, self.RRC_Succ, self.Timing_Advance, self.tilt):
+            if invalid.any():                                                                       # Same rules and messages as the Cell setters, checked for every row at once
+                raise ValueError(message)
+
+    @classmethod
+    def from_cells(cls, cells):
+        return cls(*[[getattr(cell, field) for cell in cells] for field in cls.FIELDS], state=[cell.state_code for cell in cells])
+
+    @classmethod
+    def from_csv(cls, source):
+        return load_cell_table(source)                                                              # Read in chunks, see iter_cell_batches
+
+    @classmethod
+    def concatenate(cls, tables):
+        tables = list(tables)
+        columns = [np.concatenate([getattr(table, field) for table in tables]) if tables else [] for field in cls.FIELDS]
+        states = np.concatenate([table.state for table in tables]) if tables else None
+        return cls(*columns, state=states)
+
+
+def _invalid_rows(RRC_Att, RRC_Succ, Timing_Advance, tilt):
+    return [
+        (RRC_Att < 0, "RRC_Att value cannot be less than 0"),
+        (RRC_Succ > RRC_Att, "RRC_Succ value cannot be greater than RRC_Att"),
+        (RRC_Succ < 0, "RRC_Succ value cannot be less than 0"),
+        (Timing_Advance > 100, "Timing_Advance value cannot be more than 100"),
+        (Timing_Advance < 0, "Timing_Advance value cannot be less than 0"),
+        (tilt > 100, "Tilt value cannot be more than 100"),
+        (tilt < 0, "Tilt value cannot be less than 0"),
+    ]
+
+
+EXIT_OK = 0
+EXIT_FAILED = 1                                                                 #At least one input file could not be processed, argparse exits with 2 for wrong arguments
+
+
+STAGES = ["get_input_data", "load_cell_table", "get_closest_neighbor_distance", "analyze_and_update_data", "save_output_data", "write_output"]   #Stage names which can be given to --profile
+
+
+def main(argv=None, instrumentation=None):
+    args = parse_arguments(argv)
+    metrics = instrumentation or Instrumentation(enabled=args.metrics is not None or bool(args.profile), profile=args.profile, profile_dir=args.output_dir)   #Stages are only measured when metrics or a profile are asked for
+    if args.inputs:
+        status = run_batch(args, metrics)                                       #Input files are given, nothing is asked to the user
+    else:
+        run_interactive(metrics)
+        status = EXIT_OK
+    if args.metrics:
+        metrics.write(args.metrics)
+    return status
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Mobile network cell coverage optimizer. Without input files, the source file and the threshold are asked interactively.")
+    parser.add_argument("inputs", nargs="*", help="input csv files or glob patterns, e.g. 'regions/*.csv'")
+    parser.add_argument("-t", "--threshold", type=_threshold_argument, help="RRC Success Rate Percentage Threshold, between 0 and 100")
+    parser.add_argument("-o", "--output-dir", default=".", help="folder of the output files, <input name>_output.<format> (default: current folder)")
+    parser.add_argument("-f", "--format", default="csv", choices=["csv","npz","parquet"])
+    parser.add_argument("-w", "--workers", type=int, default=1, help="worker processes for the neighbor search, shared by all input files")
+    parser.add_argument("--approximate-km", type=float, help="approximate grid neighbor search, distances are at most this much longer than the exact ones (see grid_search.py)")
+    parser.add_argument("--rejects-dir", help="folder for the bad rows of every input file, by default a bad row stops that file")
+    parser.add_argument("--metrics", help="write stage metrics to this file, Prometheus textfile format if it ends with .prom, JSON otherwise")
+    parser.add_argument("--profile", action="append", default=[], type=_profile_argument, metavar="STAGE=cprofile|tracemalloc")
+    args = parser.parse_args(argv)
+    args.profile = dict(args.profile)
+    if args.inputs and args.threshold is None:
+        parser.error("--threshold is required when input files are given")
+    return args
+
+
+def run_interactive(metrics):
     data = []                                                                   #Place holder for cell list
     data_analyzed = []                                                          #Place holder for analyzed and updated cell list
-    data = get_input_data()                                                     #Getting the cell list
+    with metrics.stage("get_input_data") as stage:
+        data = get_input_data()                                                 #Getting the cell list
+        stage["rows"] = len(data)
     RRC_Threshold = get_RRC_threshold()                                         #Getting the RRC Success Rate threshold for analysis
-    neigh_dist = get_closest_neighbor_distance(data)                            #Calculating closest neighbors to compare the given Timing Advance Value
-    data_analyzed = analyze_and_update_data(data,neigh_dist,RRC_Threshold)      #Analyzing and updating the data, inputs are list of cells and analysis parameters
-    save_output_data(data_analyzed)                                             #Writing the output of the cells in an output file
+    with metrics.stage("get_closest_neighbor_distance", rows=len(data)):
+        neigh_dist = get_closest_neighbor_distance(data)                        #Calculating closest neighbors to compare the given Timing Advance Value
+    with metrics.stage("analyze_and_update_data", rows=len(data)):
+        data_analyzed = analyze_and_update_data(data,neigh_dist,RRC_Threshold)  #Analyzing and updating the data, inputs are list of cells and analysis parameters
+    with metrics.stage("save_output_data", rows=len(data)):
+        save_output_data(data_analyzed)                                         #Writing the output of the cells in an output file
+
+
+def run_batch(args, metrics):
+    input_files = []
+    failed = 0
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"Could not find any file matching {pattern}", file=sys.stderr)
+            failed += 1
+        input_files.extend(matches)
+    os.makedirs(args.output_dir, exist_ok=True)
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None         #One worker pool is reused by every input file
+    used_names = {}                                                                                #Output name to the input file using it, north/cells.csv and south/cells.csv would overwrite each other's output
+    try:
+        for input_file in input_files:
+            name = _output_name(input_file)
+            if name in used_names:
+                print(f"Could not process {input_file}: {used_names[name]} has the same name, its {name}_output.{args.format} would be overwritten, please rename one of them", file=sys.stderr)
+                failed += 1
+                continue
+            used_names[name] = input_file
+            try:
+                process_file(input_file, args, metrics, executor)
+            except (OSError, ValueError) as error:                                                 #A bad file does not stop the other files
+                print(f"Could not process {input_file}: {error}", file=sys.stderr)
+                failed += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def process_file(input_file, args, metrics, executor=None):
+    name = _output_name(input_file)
+    rejects = os.path.join(args.rejects_dir, f"{name}_rejects.csv") if args.rejects_dir else None
+    if rejects:
+        os.makedirs(args.rejects_dir, exist_ok=True)
+    with metrics.stage("load_cell_table", input=input_file) as stage:
+        table = load_cell_table(input_file, rejects=rejects)
+        stage["rows"] = len(table)
+    with metrics.stage("get_closest_neighbor_distance", rows=len(table), input=input_file):
+        if args.approximate_km is not None:
+            from grid_search import get_approximate_neighbor_distance                              # Imported here, grid_search imports this module
+            neigh_dist = get_approximate_neighbor_distance(table, args.approximate_km)
+        else:
+            neigh_dist = get_closest_neighbor_distance(table, workers=args.workers, executor=executor)
+    with metrics.stage("analyze_and_update_data", rows=len(table), input=input_file):
+        analyze_and_update_data(table, neigh_dist, args.threshold)
+    output_file = os.path.join(args.output_dir, f"{name}_output.{args.format}")
+    with metrics.stage("write_output", rows=len(table), input=input_file):
+        write_output(table, output_file, args.format)
+    print(f"Results saved under {output_file}")
+    return output_file
+
+
+def _output_name(input_file):
+    return os.path.splitext(os.path.basename(input_file))[0]
+
+
+def _threshold_argument(text):
+    RRC_tresh = parse_RRC_threshold(text)
+    if RRC_tresh is None:
+        raise argparse.ArgumentTypeError("RRC Success Rate Threshold should be a percentage value between 0 and 100")
+    return RRC_tresh
+
+
+def _profile_argument(text):
+    stage, _, profiler = text.partition("=")
+    profiler = profiler or "cprofile"
+    if stage not in STAGES:
+        raise argparse.ArgumentTypeError(f"Unknown stage {stage}, please select one of {', '.join(STAGES)}")
+    if profiler not in PROFILERS:
+        raise argparse.ArgumentTypeError(f"Unknown profiler {profiler} for {stage}, please select {' or '.join(PROFILERS)}")
+    return stage, profiler
 
 
 def get_input_data():
@@ -159,79 +408,516 @@ def get_input_data():
         return cells
 
 
+CHUNK_SIZE = 65536                                                                                  # Number of csv rows parsed into one batch, peak memory of the loader depends on this, not on the file size
+
+
+def load_cell_table(source, chunk_size=CHUNK_SIZE, rejects=None):
+    return CellTable.concatenate(iter_cell_batches(source, chunk_size, rejects))                   # Non-interactive loader, source is a path or an open file
+
+
+def iter_cell_batches(source, chunk_size=CHUNK_SIZE, rejects=None):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="") as file:
+            yield from iter_cell_batches(file, chunk_size, rejects)
+        return
+    if isinstance(rejects, (str, os.PathLike)):
+        with open(rejects, "w", newline="") as reject_file:
+            yield from iter_cell_batches(source, chunk_size, reject_file)
+        return
+    reader = csv.reader(source)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError(f"{getattr(source, 'name', 'input')} is empty, a header row is expected")   # StopIteration would end the generator with a RuntimeError
+    missing = [field for field in CellTable.FIELDS if field not in header]
+    if missing:
+        raise ValueError(f"{getattr(source, 'name', 'input')} has no {', '.join(missing)} column in its header row")
+    positions = [header.index(field) for field in CellTable.FIELDS]                                 # Columns are picked by name, like csv.DictReader does
+    reject_writer = None
+    if rejects is not None:                                                                         # Without a reject file the first bad row raises ValueError, like get_input_data
+        reject_writer = csv.writer(rejects)
+        reject_writer.writerow(["line","reason"] + header)
+    while True:
+        rows = list(itertools.islice(reader, chunk_size))
+        if not rows:
+            return
+        first_line = reader.line_num - len(rows) + 1                                                # Line numbers are counted with the header as line 1, multi-line quoted rows are not expected
+        batch = _parse_batch(rows, first_line, positions, reject_writer)
+        if len(batch):
+            yield batch
+
+
+def _parse_batch(rows, first_line, positions, reject_writer):
+    names = []
+    columns = [np.empty(len(rows)), np.empty(len(rows)), np.empty(len(rows)),                       # Latitude, Longitude, Azimuth, RRC_Att, RRC_Succ, Timing_Advance, tilt typed arrays filled row by row
+               np.empty(len(rows), dtype=np.int64), np.empty(len(rows), dtype=np.int64),
+               np.empty(len(rows)), np.empty(len(rows), dtype=np.int64)]
+    parsers = [float, float, float, int, int, float, int]                                           # Same conversions as the Cell setters
+    lines = []
+    kept = []
+    rejected = []
+    for offset, row in enumerate(rows):
+        if not row:                                                                                 # Blank lines are skipped, like csv.DictReader does
+            continue
+        n = len(names)
+        try:
+            values = [row[position] for position in positions]
+            for column, parse, value in zip(columns, parsers, values[1:]):
+                column[n] = parse(value)
+        except (ValueError, IndexError) as error:
+            rejected.append((first_line + offset, f"could not read row: {error}", row))
+            continue
+        names.append(values[0])
+        lines.append(first_line + offset)
+        kept.append(row)
+    columns = [column[:len(names)] for column in columns]
+    bad = np.zeros(len(names), dtype=bool)
+    for invalid, message in _invalid_rows(columns[3], columns[4], columns[5], columns[6]):        # First rule broken by a row is its reason, same order as the Cell setters
+        for i in np.flatnonzero(invalid & ~bad).tolist():
+            rejected.append((lines[i], message, kept[i]))
+        bad |= invalid
+    rejected.sort(key=lambda reject: reject[0])
+    if rejected and reject_writer is None:
+        line, reason, _ = rejected[0]
+        raise ValueError(f"line {line}: {reason}")
+    for line, reason, row in rejected:
+        reject_writer.writerow([line, reason] + row)
+    good = ~bad
+    return CellTable(np.array(names, dtype=object)[good], *[column[good] for column in columns])
+
+
 def get_RRC_threshold():
     while True:
         RRC_tresh = input("What is the RRC Success Rate Percentage Threshold? ")
-        if (match := re.search(r"^%?(\d\d?)%?$",RRC_tresh)) or (match := re.search(r"^%?(100)%?$",RRC_tresh)):
-            return int(match.group(1))
+        if (threshold := parse_RRC_threshold(RRC_tresh)) is not None:
+            return threshold
         else:
             print("RRC Success Rate Threshold should be a percentage value between 0 and 100, please try again")
             continue
 
 
-def get_closest_neighbor_distance(cells):
+def parse_RRC_threshold(RRC_tresh):
+    if (match := re.search(r"^%?(\d\d?)%?$",RRC_tresh)) or (match := re.search(r"^%?(100)%?$",RRC_tresh)):
+        return int(match.group(1))
+    return None
+
+
+NEIGHBOR_BATCH = 16                                                                                 # First number of neighbors asked per cell, doubled for the cells that still have no neighbor in front
+NEIGHBOR_QUERY_BUDGET = 1_000_000                                                                   # Maximum number of (cell, neighbor) pairs held in memory by a single kneighbors query
+
+
+class SiteIndex:
+    def __init__(self, longitudes, latitudes):
+        coordinates = np.column_stack([np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float)])
+        sites, site_of_cell = np.unique(coordinates, axis=0, return_inverse=True)                  # Cells sharing the exact same Latitude and Longitude are the sectors of one site
+        self.coordinates = sites
+        self.radian_coordinates = np.radians(sites)                                                 # Same [Longitude, Latitude] column order given to the haversine tree as before
+        self.site_of_cell = site_of_cell.reshape(-1)                                                # Site number of every cell, in input order
+
+    def __len__(self):
+        return len(self.radian_coordinates)
+
+    @classmethod
+    def from_cells(cls, cells):
+        return cls([cell.Longitude for cell in cells], [cell.Latitude for cell in cells])
+
+    @classmethod
+    def from_radians(cls, radian_coordinates, site_of_cell):                                        # Builds the index of a part of the network without grouping the cells again
+        sites = cls.__new__(cls)
+        sites.coordinates = np.degrees(radian_coordinates)
+        sites.radian_coordinates = radian_coordinates
+        sites.site_of_cell = site_of_cell
+        return sites
+
+
+def geometry_keys(cells):
+    if not isinstance(cells, CellTable):
+        cells = CellTable.from_cells(cells)
+    keys = np.empty(len(cells), dtype=np.uint64)                                                    # One 64 bit hash of (CellName, Latitude, Longitude, Azimuth) per cell
+    rows = zip(cells.CellName.tolist(), cells.Latitude.tolist(), cells.Longitude.tolist(), cells.Azimuth.tolist())
+    for i, (name, latitude, longitude, azimuth) in enumerate(rows):
+        digest = hashlib.blake2b(f"{name}|{latitude!r}|{longitude!r}|{azimuth!r}".encode(), digest_size=8).digest()
+        keys[i] = int.from_bytes(digest, "little")
+    return keys
+
+
+TILE_MARGIN_KM = 50                                                                                 # Overlap between geographic tiles, longer than the neighbor distances expected in a real network
+TILES_PER_WORKER = 4
+
+
+def get_closest_neighbor_distance(cells, k=NEIGHBOR_BATCH, vectorized=True, workers=1, margin_km=TILE_MARGIN_KM, executor=None):
     closest_neighbor = []                                                                           # Creates an empty list to store and return the names of all cells and the distances of their respective closest neighbor cell in front.
-    radian_coordinates = np.radians(np.array([[cell.Longitude, cell.Latitude] for cell in cells]))  # Create a radian numPy ndarray (as Haversine formulation uses radians) consist of the latitude and longitude of the points
-    nbrs = NearestNeighbors(n_neighbors=len(cells), metric='haversine').fit(radian_coordinates)     # Created NearestNeighbors object for all neighbors
-    distances, indices = nbrs.kneighbors(radian_coordinates)                                        # Neighbor distances and their indices are calculated and stored from closest to farthest
-    for i, cell in enumerate(cells):                                                            # Iterating over the source cells to find the first neighbor cell falls within ±60° azimuth in front of source cell.
-        source_latitude = math.radians(cell.Latitude)                                           # Convert source cell latitude degrees to radians
-        source_longitude = math.radians(cell.Longitude)                                         # Convert source cell longitude degrees to radians
-        azi = float(cell.Azimuth)
-        minimum_distance = 0
-        for k in range(3, len(cells)):                                                          # Iterating over the neighbors, assuming all the source cell locations (sites) have 3 cells, in real life most of the cases like that, but not always.
-            neighbor = cells[indices[i, k]]                                                     # Indices array holds the neighbor indices, cells[indices[i,k]] refers to an individual neighbor cell instance in input cells list, for each for loop turn
-            neighbor_latitude = math.radians(neighbor.Latitude)                                 # Convert neighbor cell latitude to degrees radians
-            neighbor_longitude = math.radians(neighbor.Longitude)                               # Convert neighbor cell longitude to degrees radians
-            delta_longitude = neighbor_longitude - source_longitude                             # Mathematical calculation of forward azimuth (bearing) between two points on a sphere
-            x = math.sin(delta_longitude) * math.cos(neighbor_latitude)
-            y = math.cos(source_latitude) * math.sin(neighbor_latitude) - math.sin(source_latitude) * math.cos(neighbor_latitude) * math.cos(delta_longitude)
-            bearing = (math.degrees(math.atan2(x, y)) + 360) % 360
-            if min(abs(bearing - azi), 360 - abs(bearing - azi)) <= 60:                         # Checking if the angular difference between azimuth of source cell and bearing between source and neighbor cell is within azimuth ±60° or not
-                minimum_distance = distances[i, k] * 6371                                       # if True, set the first valid (nearest) match and break the loop
-                break
+    if isinstance(cells, CellTable):                                                                # A CellTable already holds its columns as numPy arrays
+        sites = SiteIndex(cells.Longitude, cells.Latitude)
+        azimuths = cells.Azimuth
+        names = cells.CellName.tolist()
+    else:
+        sites = SiteIndex.from_cells(cells)                                                         # Neighbors are searched once per site, every sector of the site shares the same candidates
+        azimuths = np.array([float(cell.Azimuth) for cell in cells])
+        names = [cell.CellName for cell in cells]
+    if workers > 1 or executor is not None:                                                         # Tiles are searched in worker processes, an existing executor can be given to reuse its workers
+        minimum_distances = _parallel_in_front_distances(sites, azimuths, workers, margin_km, k, vectorized, executor)
+    else:
+        minimum_distances = _in_front_distances(sites, azimuths, np.arange(len(names)), k, vectorized)
+    for name, minimum_distance in zip(names, minimum_distances.tolist()):
+        closest_neighbor.append({"name": name, "dist": minimum_distance})                           # accumulate the source cell name and closest neighbor distance in a list of dicts to return
+    return closest_neighbor
+
+
+def _in_front_distances(sites, azimuths, sources, k=NEIGHBOR_BATCH, vectorized=True, return_sites=False, nbrs=None):
+    radian_coordinates = sites.radian_coordinates                                                   # Haversine formulation uses radians
+    if nbrs is None:
+        nbrs = neighbor_search(radian_coordinates)                                                  # Created nearest neighbors object over the sites, the number of neighbors is given per query below
+    minimum_distances = np.zeros(len(sources))                                                      # Distance stays 0 for the cells without any neighbor in front, as before
+    neighbor_sites = np.full(len(sources), -1)                                                      # Site number of the neighbor in front, -1 when there is none
+    pending = np.arange(len(sources))                                                               # Positions in sources of the cells still looking for a neighbor in front
+    k = min(k, len(sites))
+    scan = False
+    while len(pending):
+        pending = pending[np.argsort(sites.site_of_cell[sources[pending]], kind="stable")]          # Sectors of the same site are kept next to each other
+        pending_site = sites.site_of_cell[sources[pending]]
+        pending_sites = np.unique(pending_site)
+        still_pending = []
+        rows_per_query = max(1, NEIGHBOR_QUERY_BUDGET // (len(sites) if scan else k))               # Querying in site chunks keeps the distance and index matrices at most rows_per_query x k
+        for chunk_start in range(0, len(pending_sites), rows_per_query):
+            chunk_sites = pending_sites[chunk_start:chunk_start + rows_per_query]
+            low = np.searchsorted(pending_site, chunk_sites[0], side="left")
+            high = np.searchsorted(pending_site, chunk_sites[-1], side="right")
+            chunk = pending[low:high]                                                               # Every pending sector of the sites in this chunk
+            rows = np.searchsorted(chunk_sites, pending_site[low:high])                             # Row of the site of each sector in the distance and index matrices
+            if scan:
+                found, found_distances, found_sites = _scan_in_front(radian_coordinates, azimuths[sources[chunk]], chunk_sites, rows)
+                minimum_distances[chunk[found]] = found_distances[found]
+                neighbor_sites[chunk[found]] = found_sites[found]
+                continue
+            distances, indices = nbrs.kneighbors(radian_coordinates[chunk_sites], n_neighbors=k)   # Neighbor site distances and their indices are calculated and stored from closest to farthest, only k of them
+            if vectorized:
+                found, found_distances, found_sites = _first_neighbors_in_front(radian_coordinates, azimuths[sources[chunk]], chunk_sites, rows, distances, indices)
+                minimum_distances[chunk[found]] = found_distances[found]
+                neighbor_sites[chunk[found]] = found_sites[found]
+                still_pending.append(chunk[~found])
             else:
+                for position, row in zip(chunk, rows):
+                    found = _first_neighbor_in_front(radian_coordinates, azimuths[sources[position]], chunk_sites[row], distances[row], indices[row])
+                    if found is None:
+                        still_pending.append([position])
+                    else:
+                        minimum_distances[position], neighbor_sites[position] = found
+        if scan or k == len(sites):                                                                 # Every site has been looked at, the remaining cells have nothing in front of them
+            break
+        pending = np.concatenate(still_pending).astype(int)
+        k = min(k * 2, len(sites))                                                                  # Going back for more neighbors only for the cells that did not find one in the current batch
+        scan = k > max(NEIGHBOR_BATCH, len(sites) * FULL_SCAN_FRACTION)                             # Cells with nothing in front nearby are finished with a scan of every site instead of ever larger tree queries
+    if return_sites:
+        return minimum_distances, neighbor_sites
+    return minimum_distances
+
+
+FULL_SCAN_FRACTION = 1 / 64                                                                         # Above this fraction of the sites as k, the remaining cells scan every site
+
+
+BRUTE_FORCE_SITES = 2000                                                                            # Up to this many sites, distances are calculated with numPy and scikit-learn is not imported at all
+
+
+def neighbor_search(radian_coordinates):
+    if len(radian_coordinates) <= BRUTE_FORCE_SITES:
+        return _BruteForceNeighbors(radian_coordinates)
+    from sklearn.neighbors import NearestNeighbors                                                  # Imported only when a large network is searched, it takes longer than the rest of the program to import
+    return NearestNeighbors(metric='haversine').fit(radian_coordinates)
+
+
+class _BruteForceNeighbors:
+    def __init__(self, radian_coordinates):
+        self.radian_coordinates = radian_coordinates
+
+    def kneighbors(self, X, n_neighbors):                                                           # Same result as NearestNeighbors(metric='haversine').kneighbors
+        distances = np.empty((len(X), n_neighbors))
+        indices = np.empty((len(X), n_neighbors), dtype=np.int64)
+        rows_per_block = max(1, NEIGHBOR_QUERY_BUDGET // len(self.radian_coordinates))              # Full distance rows are calculated for a bounded block of query points at a time
+        for start in range(0, len(X), rows_per_block):
+            block = slice(start, start + rows_per_block)
+            all_distances = _haversine(X[block, None, :], self.radian_coordinates[None, :, :])
+            indices[block] = np.argsort(all_distances, axis=1, kind="stable")[:, :n_neighbors]
+            distances[block] = np.take_along_axis(all_distances, indices[block], axis=1)
+        return distances, indices
+
+
+def _haversine(first, second):
+    sin_0 = np.sin(0.5 * (first[..., 0] - second[..., 0]))                                          # Written in the same order as the scikit-learn haversine metric, so the distances are exactly the same
+    sin_1 = np.sin(0.5 * (first[..., 1] - second[..., 1]))
+    return 2 * np.arcsin(np.sqrt(sin_0 * sin_0 + np.cos(first[..., 0]) * np.cos(second[..., 0]) * sin_1 * sin_1))
+
+
+def _parallel_in_front_distances(sites, azimuths, workers, margin_km, k=NEIGHBOR_BATCH, vectorized=True, executor=None):
+    azimuths = np.asarray(azimuths, dtype=float)
+    margin = margin_km / 6371                                                                       # Distance on the first tree coordinate is never longer than the haversine distance, so tiles are cut along it
+    order = np.argsort(sites.radian_coordinates[:, 0], kind="stable")
+    tile_count = max(1, min(len(sites), max(workers, 1) * TILES_PER_WORKER))
+    cells_by_site = np.argsort(sites.site_of_cell, kind="stable")                                   # Cells of every site next to each other, to find the cells of a tile quickly
+    first_cell = np.searchsorted(sites.site_of_cell[cells_by_site], np.arange(len(sites) + 1))
+    shared = [_share(sites.radian_coordinates), _share(azimuths), _share(sites.site_of_cell)]       # Workers read the arrays from shared memory instead of receiving a pickled copy per tile
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        jobs = []
+        for core_sites in np.array_split(order, tile_count):
+            if len(core_sites) == 0:
                 continue
-        closest_neighbor.append({"name": cell.CellName, "dist": minimum_distance})              # accumulate the source cell name and closest neighbor distance in a list of dicts to return
-    return closest_neighbor
+            low, high = sites.radian_coordinates[core_sites[[0, -1]], 0]
+            tile_sites = np.flatnonzero((sites.radian_coordinates[:, 0] >= low - margin) & (sites.radian_coordinates[:, 0] <= high + margin))
+            core_sites = np.sort(core_sites)
+            core_cells = cells_by_site[np.concatenate([np.arange(first_cell[site], first_cell[site + 1]) for site in core_sites])]
+            jobs.append((core_cells, executor.submit(_tile_worker, [block for block, _ in shared], core_cells, tile_sites, k, vectorized)))
+        minimum_distances = np.zeros(len(azimuths))
+        for core_cells, job in jobs:
+            minimum_distances[core_cells] = job.result()
+        unsure = np.flatnonzero((minimum_distances == 0) | (minimum_distances > margin_km))         # Neighbor might be outside the tile, these cells are searched again over the whole network
+        unsure = unsure[np.argsort(sites.site_of_cell[unsure], kind="stable")]                      # Sectors of the same site go to the same worker, they share the candidates
+        all_sites = np.arange(len(sites))
+        jobs = [(cells, executor.submit(_tile_worker, [block for block, _ in shared], cells, all_sites, k, vectorized))
+                for cells in np.array_split(unsure, max(workers, 1)) if len(cells)]                 # The slowest cells are split across the workers as well, instead of being searched in this process
+        for cells, job in jobs:
+            minimum_distances[cells] = job.result()
+    finally:
+        if own_executor:
+            executor.shutdown()
+        for _, memory in shared:
+            memory.close()
+            memory.unlink()
+    return minimum_distances
+
+
+def _share(array):
+    memory = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    return (memory.name, array.shape, array.dtype.str), memory
+
+
+def _tile_worker(blocks, core_cells, tile_sites, k, vectorized):
+    memories = [shared_memory.SharedMemory(name=name) for name, _, _ in blocks]
+    try:
+        return _tile_distances(memories, blocks, core_cells, tile_sites, k, vectorized)
+    finally:
+        for memory in memories:
+            memory.close()
+
+
+def _tile_distances(memories, blocks, core_cells, tile_sites, k, vectorized):
+    radian_coordinates, azimuths, site_of_cell = [np.ndarray(shape, dtype=dtype, buffer=memory.buf) for memory, (_, shape, dtype) in zip(memories, blocks)]
+    local_sites = SiteIndex.from_radians(radian_coordinates[tile_sites], np.searchsorted(tile_sites, site_of_cell[core_cells]))   # Sites of the tile and its overlap only, renumbered from 0
+    return _in_front_distances(local_sites, azimuths[core_cells], np.arange(len(core_cells)), k, vectorized)
+
+
+def _first_neighbor_in_front(radian_coordinates, azi, site, distances, indices):
+    source_longitude, source_latitude = radian_coordinates[site]                                    # Finds the first neighbor site falls within ±60° azimuth in front of the source cell, None if there is none in this batch
+    for k in range(len(indices)):                                                                   # Iterating over the neighbor sites, the source cell's own site (its co-located sectors) is never a neighbor
+        if indices[k] == site:
+            continue
+        neighbor_longitude, neighbor_latitude = radian_coordinates[indices[k]]
+        delta_longitude = neighbor_longitude - source_longitude                                     # Mathematical calculation of forward azimuth (bearing) between two points on a sphere
+        x = math.sin(delta_longitude) * math.cos(neighbor_latitude)
+        y = math.cos(source_latitude) * math.sin(neighbor_latitude) - math.sin(source_latitude) * math.cos(neighbor_latitude) * math.cos(delta_longitude)
+        bearing = (math.degrees(math.atan2(x, y)) + 360) % 360
+        if min(abs(bearing - azi), 360 - abs(bearing - azi)) <= 60:                                 # Checking if the angular difference between azimuth of source cell and bearing between source and neighbor cell is within azimuth ±60° or not
+            return distances[k] * 6371, indices[k]                                                  # if True, return the first valid (nearest) match and its site
+    return None
+
+
+def _bearing(source_latitude, source_longitude, neighbor_latitude, neighbor_longitude):
+    delta_longitude = neighbor_longitude - source_longitude                                         # Same forward azimuth (bearing) formulation as the scalar loop, for whole numPy arrays at once
+    x = np.sin(delta_longitude) * np.cos(neighbor_latitude)
+    y = np.cos(source_latitude) * np.sin(neighbor_latitude) - np.sin(source_latitude) * np.cos(neighbor_latitude) * np.cos(delta_longitude)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def _first_neighbors_in_front(radian_coordinates, azimuths, sites, rows, distances, indices):
+    source_longitude = radian_coordinates[sites, 0][:, None]                                        # Bearings are calculated once per (site x candidate site) block
+    source_latitude = radian_coordinates[sites, 1][:, None]
+    bearing = _bearing(source_latitude, source_longitude, radian_coordinates[indices, 1], radian_coordinates[indices, 0])
+    bearing[indices == sites[:, None]] = np.nan                                                     # The site itself is never a neighbor, nan fails the azimuth comparison below
+    difference = np.abs(bearing[rows] - azimuths[:, None])                                          # Each sector gets its site's row, compared with its own azimuth
+    in_front = np.minimum(difference, 360 - difference) <= 60                                       # ±60° azimuth mask for every candidate of every source cell
+    found = in_front.any(axis=1)
+    first = in_front.argmax(axis=1)                                                                 # argmax returns the first True column, which is the nearest valid neighbor
+    return found, distances[rows, first] * 6371, indices[rows, first]
+
+
+def _scan_in_front(radian_coordinates, azimuths, sites, rows):                                     # Nearest site in front among all the sites, same result as _first_neighbors_in_front with k = every site
+    distances = _haversine(radian_coordinates[sites][:, None, :], radian_coordinates[None, :, :])
+    bearing = _bearing(radian_coordinates[sites, 1][:, None], radian_coordinates[sites, 0][:, None], radian_coordinates[None, :, 1], radian_coordinates[None, :, 0])
+    bearing[np.arange(len(sites)), sites] = np.nan                                                  # The site itself is never a neighbor
+    difference = np.abs(bearing[rows] - azimuths[:, None])
+    in_front_distances = np.where(np.minimum(difference, 360 - difference) <= 60, distances[rows], np.inf)
+    first = in_front_distances.argmin(axis=1)
+    nearest = in_front_distances[np.arange(len(rows)), first]
+    return np.isfinite(nearest), nearest * 6371, first
 
 
 def analyze_and_update_data(cells,neigh_dist,RRC_tresh):
-    for cell in cells:
-        for dist in neigh_dist:
-            if dist["name"] == cell.CellName:
-                if (cell.RRC_Succ/cell.RRC_Att)*100 < RRC_tresh and cell.Timing_Advance*1.1 > dist["dist"]:
-                    if cell.tilt <= 80:
-                        cell.state = "Overshooter, cell downtilted 20 degrees"
-                        cell.downtilt()
-                    elif 80 < cell.tilt <= 100:
-                        cell.state = "Overshooter, cell downtilted less than 20 degrees"
-                        cell.downtilt()
-                    else:
-                        cell.state = "Tilt value cannot be increased further"
-                elif (cell.RRC_Succ/cell.RRC_Att)*100 < RRC_tresh and cell.Timing_Advance*0.25 < dist["dist"]:
-                    if cell.tilt >= 20:
-                        cell.state = "Undershooter, cell uptilted 20 degrees"
-                        cell.uptilt()
-                    elif 0 < cell.tilt < 20:
-                        cell.state = "Undershooter, cell uptilted less than 20 degrees"
-                        cell.uptilt()
-                    else:
-                        cell.state = "Tilt value cannot be decreased further"
-                else:
-                    continue
+    distances = {dist["name"]: dist["dist"] for dist in neigh_dist}                                 # Name lookup of the closest neighbor distances, instead of looking through the whole list for every cell
+    table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+    dist = np.array([distances.get(name, np.nan) for name in table.CellName.tolist()])             # Cells without a neighbor distance get nan, which fails every rule below, so they are left as they are
+    new_tilt, state = tilt_decision_kernel(table.RRC_Att, table.RRC_Succ, table.Timing_Advance, table.tilt, dist, RRC_tresh)
+    decided = state != State.NO_ACTION
+    if isinstance(cells, CellTable):
+        cells.tilt[decided] = new_tilt[decided]
+        cells.state[decided] = state[decided]
+    else:
+        for i, code, tilt in zip(np.flatnonzero(decided).tolist(), state[decided].tolist(), new_tilt[decided].tolist()):   # Only the cells with a decision are touched, the others keep their state
+            cells[i].state = code
+            cells[i].tilt = tilt
     return cells
 
 
-def save_output_data(cells):
-    with open("output.csv","w") as file:
-        writer = csv.DictWriter(file, fieldnames=["CellName","Latitude","Longitude","RRC_Att","RRC_Succ","Timing_Advance","tilt","state"])
-        writer.writeheader()
-        for cell in cells:
-            writer.writerow({"CellName" : cell.CellName, "Latitude" : cell.Latitude, "Longitude" : cell.Longitude,"RRC_Att" : cell.RRC_Att,
-                             "RRC_Succ" : cell.RRC_Succ, "Timing_Advance" : cell.Timing_Advance, "tilt" : cell.tilt, "state" : cell.state})
-    print("Results saved under output.csv")
+def tilt_decision_kernel(RRC_Att, RRC_Succ, Timing_Advance, tilt, dist, RRC_tresh, over_factor=1.1, under_factor=0.25):
+    with np.errstate(divide="ignore", invalid="ignore"):                                            # A cell without RRC attempts has no success rate and takes no action
+        low_success_rate = (RRC_Succ / RRC_Att) * 100 < RRC_tresh
+    overshooter = low_success_rate & (Timing_Advance * over_factor > dist)                         # Tolerated timing advance (increased by 10%) is greater than the closest neighbor distance
+    undershooter = low_success_rate & ~overshooter & (Timing_Advance * under_factor < dist)       # Tolerated timing advance (decreased by 75%) is less than the closest neighbor distance
+    new_tilt = np.where(overshooter, np.minimum(tilt + 20, 100), np.where(undershooter, np.maximum(tilt - 20, 0), tilt))   # Same ±20 steps clamped to 0-100 as Cell.downtilt and Cell.uptilt
+    state = np.select(
+        [overshooter & (tilt <= 80), overshooter & (tilt <= 100), overshooter,
+         undershooter & (tilt >= 20), undershooter & (tilt > 0), undershooter],
+        [State.OVERSHOOTER_DOWNTILTED, State.OVERSHOOTER_DOWNTILTED_LESS, State.TILT_CANNOT_BE_INCREASED,
+         State.UNDERSHOOTER_UPTILTED, State.UNDERSHOOTER_UPTILTED_LESS, State.TILT_CANNOT_BE_DECREASED],
+        State.NO_ACTION).astype(np.int8)
+    return new_tilt, state
+
+
+OVERSHOOTER_STATES = [State.OVERSHOOTER_DOWNTILTED, State.OVERSHOOTER_DOWNTILTED_LESS, State.TILT_CANNOT_BE_INCREASED]
+UNDERSHOOTER_STATES = [State.UNDERSHOOTER_UPTILTED, State.UNDERSHOOTER_UPTILTED_LESS, State.TILT_CANNOT_BE_DECREASED]
+
+
+def sweep_thresholds(cells, neigh_dist, thresholds, over_factors=(1.1,), under_factors=(0.25,), per_cell=False):
+    table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+    distances = {dist["name"]: dist["dist"] for dist in neigh_dist}                                 # One neighbor distance calculation is reused by every scenario
+    dist = np.array([distances.get(name, np.nan) for name in table.CellName.tolist()])
+    threshold, over_factor, under_factor = [grid.reshape(-1) for grid in np.meshgrid(thresholds, over_factors, under_factors, indexing="ij")]   # Every combination is a scenario
+    if len(threshold) == 0:
+        raise ValueError("At least one threshold, over_factor and under_factor is required")
+    overshooters = np.zeros(len(threshold), dtype=np.int64)
+    undershooters = np.zeros(len(threshold), dtype=np.int64)
+    if per_cell:
+        new_tilts = np.empty((len(table), len(threshold)), dtype=np.int8)                          # (cells x scenarios) decisions, tilt fits in int8 as it stays between 0 and 100
+        states = np.empty((len(table), len(threshold)), dtype=np.int8)
+    rows_per_block = max(1, NEIGHBOR_QUERY_BUDGET // len(threshold))                                # Cells are taken in blocks so the (cells x scenarios) arrays stay bounded
+    for start in range(0, len(table), rows_per_block):
+        block = slice(start, start + rows_per_block)
+        column = lambda values: values[block][:, None]                                              # Cells along the first axis, scenarios along the second one
+        new_tilt, state = tilt_decision_kernel(column(table.RRC_Att), column(table.RRC_Succ), column(table.Timing_Advance), column(table.tilt), column(dist),
+                                               threshold, over_factor, under_factor)
+        overshooters += np.isin(state, OVERSHOOTER_STATES).sum(axis=0)
+        undershooters += np.isin(state, UNDERSHOOTER_STATES).sum(axis=0)
+        if per_cell:
+            new_tilts[block] = new_tilt
+            states[block] = state
+    summary = [{"threshold": t, "over_factor": o, "under_factor": u, "overshooters": over, "undershooters": under}
+               for t, o, u, over, under in zip(threshold.tolist(), over_factor.tolist(), under_factor.tolist(), overshooters.tolist(), undershooters.tolist())]
+    if per_cell:
+        return summary, new_tilts, states
+    return summary
+
+
+TILT_COVERAGE_FACTOR = 0.8                                                                          # Timing advance (coverage) proxy of a cell is multiplied by this for every 20 degrees of downtilt
+MAX_ROUNDS = 20
+
+
+class SimulationReport:
+    def __init__(self):
+        self.evaluated = []                                                                         # Number of cells analyzed in every round
+        self.changed = []                                                                           # Number of cells whose tilt changed in every round
+        self.converged = False
+
+    @property
+    def rounds(self):
+        return len(self.evaluated)
+
+    def __str__(self):
+        status = "converged" if self.converged else "stopped at the round limit"
+        return f"{status} after {self.rounds} rounds, changed cells per round: {self.changed}"
+
+
+def simulate_tilt(cells, neigh_dist, RRC_tresh, max_rounds=MAX_ROUNDS):
+    table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+    distances = {dist["name"]: dist["dist"] for dist in neigh_dist}
+    dist = np.array([distances.get(name, np.nan) for name in table.CellName.tolist()])
+    start_tilt = table.tilt.copy()
+    timing_advance = table.Timing_Advance.copy()                                                    # Simulated timing advance proxy, the measured values in the table are not changed
+    last_step = np.zeros(len(table), dtype=np.int64)
+    report = SimulationReport()
+    active = np.arange(len(table))                                                                  # Only the cells changed in the previous round are analyzed again
+    while len(active) and report.rounds < max_rounds:
+        new_tilt, state = tilt_decision_kernel(table.RRC_Att[active], table.RRC_Succ[active], timing_advance[active], table.tilt[active], dist[active], RRC_tresh)
+        step = new_tilt - table.tilt[active]
+        turned_back = (step * last_step[active]) < 0                                                # Cell overshot its target in the last step, it stays where it is
+        moved = (step != 0) & ~turned_back
+        decided = (state != State.NO_ACTION) & ~turned_back
+        table.state[active[decided]] = state[decided]
+        active = active[moved]
+        table.tilt[active] = new_tilt[moved]
+        last_step[active] = step[moved]
+        coverage = TILT_COVERAGE_FACTOR ** ((table.tilt[active] - start_tilt[active]) / 20)         # Downtilt shrinks and uptilt grows the effective coverage, so the timing advance proxy
+        timing_advance[active] = np.minimum(table.Timing_Advance[active] * coverage, 100)
+        report.evaluated.append(len(moved))
+        report.changed.append(len(active))
+    report.converged = len(active) == 0
+    return table, report
+
+
+OUTPUT_FIELDS = ["CellName","Latitude","Longitude","RRC_Att","RRC_Succ","Timing_Advance","tilt","state"]
+WRITE_BLOCK = 65536                                                                                 # Number of rows handed to the csv writer at once
+
+
+def save_output_data(cells, path="output.csv"):
+    write_output(cells, path)
+    print(f"Results saved under {path}")
+
+
+def write_output(cells, path="output.csv", format=None):
+    table = cells if isinstance(cells, CellTable) else CellTable.from_cells(cells)
+    if format is None:
+        format = os.path.splitext(str(path))[1].lstrip(".").lower() or "csv"                        # Format follows the file extension unless it is given
+    if format == "csv":
+        _write_csv(table, path)
+    elif format == "npz":
+        _write_npz(table, path)
+    elif format == "parquet":
+        _write_parquet(table, path)
+    else:
+        raise ValueError(f"Unknown output format {format}, please select csv, npz or parquet")
+
+
+def _write_csv(table, path):
+    state_names = np.array(STATES, dtype=object)
+    with open(path, "w", newline="", buffering=1 << 20) as file:                                  # Large buffer, the file is written in big blocks instead of one row at a time
+        writer = csv.writer(file)
+        writer.writerow(OUTPUT_FIELDS)
+        for start in range(0, len(table), WRITE_BLOCK):
+            block = slice(start, start + WRITE_BLOCK)
+            columns = [getattr(table, field)[block].tolist() for field in OUTPUT_FIELDS[:-1]]       # tolist gives Python numbers, so the values are written exactly like the earlier DictWriter output
+            columns.append(state_names[table.state[block]].tolist())
+            writer.writerows(zip(*columns))
+
+
+def _write_npz(table, path):
+    columns = {field: getattr(table, field) for field in OUTPUT_FIELDS}
+    columns["CellName"] = table.CellName.astype(str)                                                # Fixed width text array, so the file can be loaded without pickle
+    columns["STATES"] = np.array(STATES)                                                            # state column holds the State codes, STATES[code] is the state text
+    with open(path, "wb") as file:                                                                  # Given an open file, numPy does not add .npz to the name
+        np.savez(file, **columns)
+
+
+def _write_parquet(table, path):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ValueError("Parquet output needs the pyarrow package, please install it or select csv or npz") from error
+    columns = {field: getattr(table, field) for field in OUTPUT_FIELDS}
+    columns["CellName"] = table.CellName.tolist()
+    columns["state"] = pyarrow.DictionaryArray.from_arrays(table.state, STATES)                    # State texts are stored once, rows keep the State codes
+    pyarrow.parquet.write_table(pyarrow.table(columns), path)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
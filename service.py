@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import csv
+import io
+import sys
+import numpy as np
+from project import OUTPUT_FIELDS, STATES, analyze_and_update_data, get_closest_neighbor_distance, load_cell_table, _threshold_argument
+from incremental import KPI_FIELDS, apply_kpis, _read_delta
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BATCH_ROWS = 1024                                                                               # A batch is closed at an empty line or after this many rows
+MAX_PENDING_BATCHES = 4                                                                             # Batches waiting for a decision per connection, reading stops when it is full
+
+
+class OptimizerService:
+    def __init__(self, table, neigh_dist, RRC_tresh, executor=None):
+        self.table = table                                                                          # Inventory, last tilt and state of every cell, kept in memory between batches
+        distances = {dist["name"]: dist["dist"] for dist in neigh_dist}
+        self.dist = np.array([distances.get(name, np.nan) for name in table.CellName.tolist()])
+        self.RRC_tresh = RRC_tresh
+        self.executor = executor                                                                    # None uses the default thread pool of the event loop
+        self.batches = 0
+        self.decisions = 0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_csv(cls, source, RRC_tresh, workers=1, executor=None):
+        table = load_cell_table(source)
+        neigh_dist = get_closest_neighbor_distance(table, workers=workers)                          # Neighbor search is done once, when the service starts
+        analyze_and_update_data(table, neigh_dist, RRC_tresh)                                       # First run analyzes every cell, like main()
+        return cls(table, neigh_dist, RRC_tresh, executor)
+
+    def decide(self, lines):
+        rows, RRC_Att, RRC_Succ, Timing_Advance = _read_delta(lines, self.table)
+        changed = apply_kpis(self.table, self.dist, rows, RRC_Att, RRC_Succ, Timing_Advance, self.RRC_tresh)
+        return self.table.take(changed)
+
+    async def handle(self, reader, writer):
+        header = (await reader.readline()).strip()
+        if set(KPI_FIELDS) - set(header.decode("utf-8", errors="replace").split(",")):              # A header which is not UTF-8 is answered like a wrong header
+            writer.write(_csv_lines([["ERROR", f"First line should be the header {','.join(KPI_FIELDS)}"]]) + b"\n")
+            await _close(writer)
+            return
+        queue = asyncio.Queue(MAX_PENDING_BATCHES)
+        decider = asyncio.create_task(self._decide_batches(queue, writer))
+        try:
+            batch = []
+            while line := await reader.readline():
+                line = line.strip()                                                                 # Lines stay bytes until the batch is decided, a line which is not UTF-8 fails its batch only
+                if line:
+                    batch.append(line)
+                if batch and (not line or len(batch) >= MAX_BATCH_ROWS):
+                    if not await _put(queue, [header] + batch, decider):                            # Waits while the decisions are behind, so the sender is slowed down by TCP instead of filling the memory
+                        break
+                    batch = []
+            if batch:
+                await _put(queue, [header] + batch, decider)
+            await _put(queue, None, decider)
+            await asyncio.wait({decider})
+            if not decider.cancelled() and decider.exception() is not None:
+                print(f"Connection closed, could not decide a batch: {decider.exception()!r}", file=sys.stderr)
+        finally:
+            decider.cancel()
+            await _close(writer)                                                                    # The client sees the connection closed instead of waiting for an answer
+
+    async def _decide_batches(self, queue, writer):
+        loop = asyncio.get_running_loop()
+        connected = True
+        writer.write(_csv_lines([OUTPUT_FIELDS]))
+        while (batch := await queue.get()) is not None:
+            async with self._lock:                                                                  # Batches of every connection change the same cells, they are decided one at a time
+                try:
+                    lines = [line.decode("utf-8") for line in batch]                                # UnicodeDecodeError is a ValueError, answered below
+                    changed = await loop.run_in_executor(self.executor, self.decide, lines)         # The event loop keeps reading the other connections meanwhile
+                    answer = _csv_lines(_output_rows(changed))
+                    self.decisions += len(changed)
+                except (KeyError, TypeError, ValueError) as error:
+                    answer = _csv_lines([["ERROR", str(error).strip("'")]])                         # A bad batch is answered with its error, the connection stays open
+                self.batches += 1
+            if connected:
+                try:
+                    writer.write(answer + b"\n")                                                    # An empty line closes the answer of every batch
+                    await writer.drain()                                                            # A slow reader slows down its own connection only
+                except ConnectionError:
+                    connected = False                                                               # Remaining batches are still applied to the cells
+
+
+def _output_rows(table):
+    columns = [getattr(table, field).tolist() for field in OUTPUT_FIELDS[:-1]]                      # Same values as the save_output_data layout
+    columns.append([STATES[code] for code in table.state.tolist()])
+    return zip(*columns)
+
+
+def _csv_lines(rows):
+    text = io.StringIO()
+    csv.writer(text, lineterminator="\n").writerows(rows)
+    return text.getvalue().encode("utf-8")
+
+
+async def _put(queue, batch, decider):                                                            # False when the decider stopped, nothing would take the batch from the queue anymore
+    put = asyncio.ensure_future(queue.put(batch))
+    await asyncio.wait({put, decider}, return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+        return False
+    return True
+
+
+async def _close(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+
+
+async def serve(service, host=HOST, port=PORT):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Listening on {', '.join(str(socket.getsockname()[:2]) for socket in server.sockets)}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keeps the cell inventory in memory and answers KPI batches (CellName,RRC_Att,RRC_Succ,Timing_Advance csv lines) with the changed tilt decisions")
+    parser.add_argument("input", help="cell inventory csv file")
+    parser.add_argument("-t", "--threshold", type=_threshold_argument, required=True, help="RRC Success Rate Percentage Threshold, between 0 and 100")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("-w", "--workers", type=int, default=1, help="worker processes for the neighbor search at start up")
+    args = parser.parse_args(argv)
+    try:
+        service = OptimizerService.from_csv(args.input, args.threshold, args.workers)
+    except (OSError, ValueError) as error:
+        print(f"Could not read {args.input}: {error}", file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
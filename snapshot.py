@@ -0,0 +1,99 @@
+import argparse
+import hashlib
+import json
+import sys
+import numpy as np
+from project import CellTable, geometry_keys, load_cell_table, write_output
+
+MAGIC = b"CELLSNAP"
+SCHEMA_VERSION = 1
+HEADER_SIZE = 4096                                                                                  # Magic, header length and JSON header, columns start after it
+ALIGNMENT = 64                                                                                      # Every column starts at a multiple of 64 bytes
+COLUMN_TYPES = {"Latitude": "<f8", "Longitude": "<f8", "Azimuth": "<f8", "RRC_Att": "<i8", "RRC_Succ": "<i8",
+                "Timing_Advance": "<f8", "tilt": "<i8", "state": "|i1"}                             # Same types as the CellTable columns, so mapped columns are used without conversion
+
+
+def geometry_hash(table):
+    return hashlib.blake2b(geometry_keys(table).tobytes(), digest_size=16).hexdigest()              # Changes when any cell is added, removed, renamed, moved or turned
+
+
+def write_snapshot(table, path):
+    names = np.char.encode(table.CellName.astype(str), "utf-8")                                     # Name table: fixed width UTF-8 bytes
+    columns = {"CellName": names}
+    columns.update({field: getattr(table, field).astype(dtype, copy=False) for field, dtype in COLUMN_TYPES.items()})
+    layout = []
+    offset = HEADER_SIZE
+    for field, column in columns.items():
+        layout.append({"name": field, "dtype": column.dtype.str, "offset": offset})
+        offset += -(-column.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({"schema_version": SCHEMA_VERSION, "rows": len(table), "geometry_hash": geometry_hash(table), "columns": layout}).encode()
+    if len(MAGIC) + 4 + len(header) > HEADER_SIZE:
+        raise ValueError("Snapshot header does not fit, too many columns")
+    with open(path, "wb") as file:
+        file.write(MAGIC + len(header).to_bytes(4, "little") + header)
+        for column, place in zip(columns.values(), layout):
+            file.seek(place["offset"])
+            file.write(column.tobytes())
+        file.truncate(offset)
+
+
+def read_header(path):
+    with open(path, "rb") as file:
+        start = file.read(len(MAGIC) + 4)
+        if start[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a cell snapshot")
+        header = json.loads(file.read(int.from_bytes(start[len(MAGIC):], "little")))
+    if header["schema_version"] != SCHEMA_VERSION:
+        raise ValueError(f"{path} has snapshot schema version {header['schema_version']}, version {SCHEMA_VERSION} is expected")
+    return header
+
+
+def open_snapshot(path, mode="c"):
+    header = read_header(path)
+    columns = {}
+    for place in header["columns"]:
+        if header["rows"] == 0:
+            columns[place["name"]] = np.empty(0, dtype=place["dtype"])                             # An empty file part cannot be mapped
+        else:
+            columns[place["name"]] = np.memmap(path, dtype=place["dtype"], mode=mode, offset=place["offset"], shape=(header["rows"],))   # Copy on write by default, analysis can change the columns without changing the file
+    names = np.char.decode(columns.pop("CellName"), "utf-8").astype(object)                        # Names are the only column copied, as Python strings
+    state = columns.pop("state")
+    return CellTable(names, *[columns[field] for field in CellTable.FIELDS[1:]], state=state, validate=False)   # Snapshots are written from validated tables
+
+
+def csv_to_snapshot(csv_path, snapshot_path, rejects=None):
+    write_snapshot(load_cell_table(csv_path, rejects=rejects), snapshot_path)
+
+
+def snapshot_to_csv(snapshot_path, csv_path):
+    write_output(open_snapshot(snapshot_path, mode="r"), csv_path, "csv")                           # Same columns as save_output_data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Converts cell inventories between csv and the memory mapped snapshot format")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_snapshot = commands.add_parser("to-snapshot", help="csv input file to snapshot")
+    to_snapshot.add_argument("source")
+    to_snapshot.add_argument("destination")
+    to_snapshot.add_argument("--rejects", help="csv file for the rows that cannot be read")
+    to_csv = commands.add_parser("to-csv", help="snapshot to csv in the save_output_data layout")
+    to_csv.add_argument("source")
+    to_csv.add_argument("destination")
+    info = commands.add_parser("info", help="prints the snapshot header")
+    info.add_argument("source")
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "to-snapshot":
+            csv_to_snapshot(args.source, args.destination, args.rejects)
+        elif args.command == "to-csv":
+            snapshot_to_csv(args.source, args.destination)
+        else:
+            print(json.dumps(read_header(args.source), indent=2))
+    except (OSError, ValueError) as error:
+        print(f"Could not convert {args.source}: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
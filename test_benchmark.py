@@ -0,0 +1,20 @@
+from project import SiteIndex
+from benchmark import generate_network, run_benchmark, compare
+
+
+def test_generate_network():
+    network = generate_network(5000, seed=7)
+    assert len(network) == 5000
+    assert network.CellName.tolist() == generate_network(5000, seed=7).CellName.tolist()
+    assert network.Latitude.tolist() == generate_network(5000, seed=7).Latitude.tolist()     #same seed, same network
+    assert network.Latitude.tolist() != generate_network(5000, seed=8).Latitude.tolist()
+    assert len(SiteIndex(network.Longitude, network.Latitude)) < 5000 / 2                      #most sites have more than one sector
+
+
+def test_run_benchmark_and_compare():
+    results = run_benchmark([500], memory=False)
+    assert set(results[0]["stages"]) == {"load_cell_table","get_closest_neighbor_distance","analyze_and_update_data","write_output"}
+    assert compare(results, results) == []
+    faster = [{"cells": 500, "stages": {"write_output": {"seconds": 0, "peak_mb": 0}}}]
+    slower = [{"cells": 500, "stages": {"write_output": {"seconds": 1, "peak_mb": 0}}}]
+    assert compare(slower, faster) == ["write_output with 500 cells: 1.000s, baseline 0.000s"]
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from project import Cell, CellTable, get_closest_neighbor_distance, load_cell_table
+from benchmark import generate_network
+from dependency_index import DependencyIndex
+
+INPUT = os.path.join(os.path.dirname(__file__), "input.csv")
+
+
+def test_dependency_index_changes_match_full_search():
+    table = load_cell_table(INPUT)
+    index = DependencyIndex(table)
+    assert index.neigh_dist() == get_closest_neighbor_distance(table)
+    latitude, longitude, _ = index.neighbor("CELL1")
+    assert "CELL1" in index.site_dependents(latitude, longitude)
+
+    changed = index.move_site(table.Latitude[0], table.Longitude[0], table.Latitude[0] + 0.01, table.Longitude[0])
+    table.Latitude[0:3] += 0.01                                                                 #CELL1-3 are the sectors of the first site
+    assert index.neigh_dist() == get_closest_neighbor_distance(table)
+    assert 3 <= len(changed) < len(table) // 10                                                 #only the cells around the moved site are searched again
+
+    new_cell = Cell("NEW1", table.Latitude[3] + 0.002, table.Longitude[3], 0, 10, 10, 1, 50)
+    index.insert_cells([new_cell])
+    table = CellTable.concatenate([table, CellTable.from_cells([new_cell])])
+    assert index.neigh_dist() == get_closest_neighbor_distance(table)
+
+    index.delete_site(table.Latitude[3], table.Longitude[3])
+    keep = (table.Latitude != table.Latitude[3]) | (table.Longitude != table.Longitude[3])
+    assert index.neigh_dist() == get_closest_neighbor_distance(table.take(keep))
+
+
+def test_dependency_index_many_changes(monkeypatch):
+    monkeypatch.setattr("project.BRUTE_FORCE_SITES", 0)                                         #scikit-learn tree, sites added after it are searched beside it
+    monkeypatch.setattr("dependency_index.REBUILD_SITES", 8)                                    #the tree is built again a few times below
+    table = generate_network(3000, seed=2)
+    index = DependencyIndex(table)
+    rng = np.random.default_rng(2)
+    for i in range(30):
+        row = int(rng.integers(len(table)))
+        latitude, longitude = table.Latitude[row], table.Longitude[row]
+        site = (table.Latitude == latitude) & (table.Longitude == longitude)
+        if i % 3 == 0:
+            index.move_site(latitude, longitude, latitude + 0.004, longitude - 0.002)
+            table.Latitude[site] += 0.004
+            table.Longitude[site] -= 0.002
+        elif i % 3 == 1:
+            new_cell = Cell(f"NEW{i}", latitude - 0.003, longitude, float(rng.integers(360)), 10, 10, 1, 50)
+            index.insert_cells([new_cell])
+            table = CellTable.concatenate([table, CellTable.from_cells([new_cell])])
+        else:
+            index.delete_site(latitude, longitude)
+            table = table.take(~site)
+        assert index.neigh_dist() == get_closest_neighbor_distance(table)
+
+
+def test_dependency_index_save_and_load(tmp_path):
+    index = DependencyIndex(load_cell_table(INPUT))
+    index.save(str(tmp_path / "index.npz"))
+    loaded = DependencyIndex.load(str(tmp_path / "index.npz"))
+    assert loaded.neigh_dist() == index.neigh_dist()
+    assert loaded.dependents("CELL10") == index.dependents("CELL10")
+    with pytest.raises(ValueError):
+        loaded.dependents("CELL9999")
@@ -0,0 +1,38 @@
+import os
+import warnings
+import numpy as np
+import pytest
+from project import get_closest_neighbor_distance, load_cell_table
+from benchmark import generate_network
+from grid_search import compare_with_exact, get_approximate_neighbor_distance
+
+
+def test_grid_search_without_error_is_exact():
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    assert get_approximate_neighbor_distance(table, error_km=0) == get_closest_neighbor_distance(table)
+    network = generate_network(5000, seed=4)
+    assert get_approximate_neighbor_distance(network, error_km=0) == get_closest_neighbor_distance(network)
+
+
+def test_grid_search_error_bound():
+    network = generate_network(5000, seed=4)
+    exact = np.array([dist["dist"] for dist in get_closest_neighbor_distance(network)])
+    approximate = np.array([dist["dist"] for dist in get_approximate_neighbor_distance(network, error_km=1)])
+    assert np.all(approximate >= exact) and np.all(approximate <= exact + 1)                   #never closer than the exact neighbor, at most error_km farther
+
+    report = compare_with_exact(network, 90, error_km=1)
+    assert report["cells"] == 5000 and report["max_difference_km"] <= 1
+    assert report["different_decisions"] <= report["different_distances"]
+    with pytest.raises(ValueError):
+        get_approximate_neighbor_distance(network, error_km=-1)
+
+
+def test_grid_search_any_longitude():
+    for area in ((32.5, 42.0, -124.0, -114.0), (-38.0, -25.0, 145.0, 153.0)):                    #California and eastern Australia, beyond ±89 degrees of longitude
+        network = generate_network(3000, seed=5, area=area)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")                                                     #the grid is used, no fall back to the exact search
+            assert get_approximate_neighbor_distance(network, error_km=0) == get_closest_neighbor_distance(network)
+    network = generate_network(1000, seed=5, area=(-80.0, 80.0, -180.0, 180.0))
+    with pytest.warns(RuntimeWarning):
+        assert get_approximate_neighbor_distance(network, error_km=0) == get_closest_neighbor_distance(network)
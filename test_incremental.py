@@ -0,0 +1,46 @@
+import csv
+import os
+import pytest
+from project import get_closest_neighbor_distance, load_cell_table
+from incremental import IncrementalOptimizer
+
+
+def write_delta(path, rows):
+    with open(path, "w", newline='', encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["CellName","RRC_Att","RRC_Succ","Timing_Advance"])
+        writer.writerows(rows)
+
+
+def test_incremental_delta_changed_rows(tmp_path):
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    neigh_dist = get_closest_neighbor_distance(table)
+    optimizer = IncrementalOptimizer(str(tmp_path / "state.npz"))
+    optimizer.start(table, neigh_dist, 90)
+
+    write_delta(tmp_path / "delta.csv", [["CELL1","100","50","0.31"],["CELL5","19","19","4.61"]])
+    changed = optimizer.apply_delta(tmp_path / "delta.csv", 90, output=tmp_path / "changed.csv")
+
+    assert changed.CellName.tolist() == ["CELL1","CELL5"]                                       #CELL1 success rate dropped to 50%, CELL5 went up to 100% after its uptilt in the first run
+    assert changed.tilt.tolist() == [40,40]
+    assert changed.state_names() == ["Undershooter, cell uptilted 20 degrees","No action"]
+    with open(tmp_path / "changed.csv") as file:
+        assert [row["CellName"] for row in csv.DictReader(file)] == ["CELL1","CELL5"]
+
+
+def test_incremental_unknown_cell(tmp_path):
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    optimizer = IncrementalOptimizer(str(tmp_path / "state.npz"))
+    optimizer.start(table, get_closest_neighbor_distance(table), 90)
+    write_delta(tmp_path / "delta.csv", [["CELL9999","100","50","0.31"]])
+    with pytest.raises(ValueError):
+        optimizer.apply_delta(tmp_path / "delta.csv", 90)
+
+
+def test_incremental_short_row(tmp_path):
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    optimizer = IncrementalOptimizer(str(tmp_path / "state.npz"))
+    optimizer.start(table, get_closest_neighbor_distance(table), 90)
+    write_delta(tmp_path / "delta.csv", [["CELL1","100","50","0.31"],["CELL2","100"]])
+    with pytest.raises(ValueError, match="line 3"):
+        optimizer.apply_delta(tmp_path / "delta.csv", 90)
@@ -0,0 +1,50 @@
+import json
+import os
+import shutil
+import pytest
+from instrumentation import Instrumentation
+from project import main
+
+
+def test_instrumentation_main(tmp_path,monkeypatch):
+    inputs = iter([os.path.join(os.path.dirname(__file__), "input.csv"), "90"])
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    monkeypatch.chdir(tmp_path)                                                                 #main writes output.csv in the current folder
+    metrics = Instrumentation(profile={"get_closest_neighbor_distance": "cprofile"}, profile_dir=str(tmp_path))
+
+    main([], metrics)
+
+    assert [record["stage"] for record in metrics.stages] == ["get_input_data","get_closest_neighbor_distance","analyze_and_update_data","save_output_data"]
+    assert all(record["rows"] == 750 and record["wall_seconds"] >= 0 for record in metrics.stages)
+    assert (tmp_path / "get_closest_neighbor_distance.prof").exists()
+    metrics.write(tmp_path / "metrics.json")
+    with open(tmp_path / "metrics.json") as file:
+        assert len(json.load(file)["stages"]) == 4
+
+
+def test_instrumentation_prometheus(tmp_path):
+    metrics = Instrumentation(profile={"load": "tracemalloc"}, profile_dir=str(tmp_path))
+    with metrics.stage("load") as stage:
+        stage["rows"] = len([0] * 1000)
+    metrics.write(tmp_path / "optimizer.prom")
+    text = (tmp_path / "optimizer.prom").read_text()
+    assert 'optimizer_stage_rows{stage="load"} 1000' in text
+    assert "# TYPE optimizer_stage_wall_seconds gauge" in text
+    assert metrics.stages[0]["traced_peak_bytes"] > 0
+    with pytest.raises(ValueError):
+        Instrumentation(profile={"load": "perf"})
+
+
+def test_instrumentation_profile_without_metrics(tmp_path):
+    main([os.path.join(os.path.dirname(__file__), "input.csv"), "-t", "90", "-o", str(tmp_path), "--profile", "get_closest_neighbor_distance=cprofile"])
+    assert (tmp_path / "input_get_closest_neighbor_distance.prof").exists()                    #--profile alone is enough, --metrics is not needed
+
+
+def test_instrumentation_profile_every_input(tmp_path):
+    for region in ("north", "south"):
+        shutil.copy(os.path.join(os.path.dirname(__file__), "input.csv"), tmp_path / f"{region}.csv")
+    main([str(tmp_path / "north.csv"), str(tmp_path / "south.csv"), "-t", "90", "-o", str(tmp_path / "out"), "--profile", "analyze_and_update_data=cprofile"])
+    assert sorted(name for name in os.listdir(tmp_path / "out") if name.endswith(".prof")) == ["north_analyze_and_update_data.prof","south_analyze_and_update_data.prof"]
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(tmp_path / "north.csv"), "-t", "90", "--profile", "analyse_and_update_data=cprofile"])   #no stage has this name
+    assert exit_info.value.code == 2
@@ -0,0 +1,27 @@
+import os
+from project import get_closest_neighbor_distance, load_cell_table
+from neighbor_cache import NeighborCache
+
+
+def test_neighbor_cache_reuses_unchanged_cells(tmp_path):
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    cache = NeighborCache(str(tmp_path / "neighbors.npz"))
+
+    assert cache.get_closest_neighbor_distance(table) == get_closest_neighbor_distance(table)
+    assert cache.full_rebuild                                                                   #first run has no cache file yet
+
+    assert cache.get_closest_neighbor_distance(table) == get_closest_neighbor_distance(table)
+    assert not cache.full_rebuild and cache.recomputed == 0                                      #nothing changed, nothing searched again
+
+
+def test_neighbor_cache_moved_site(tmp_path):
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    cache = NeighborCache(str(tmp_path / "neighbors.npz"))
+    cache.get_closest_neighbor_distance(table)
+
+    table.Latitude[0:3] += 0.01                                                                 #moving the first site, its sectors and the cells around it must be searched again
+    table.Azimuth[10] = 90                                                                      #turning one sector, only that sector must be searched again
+
+    assert cache.get_closest_neighbor_distance(table) == get_closest_neighbor_distance(table)
+    assert not cache.full_rebuild
+    assert 4 <= cache.recomputed < len(table) // 2
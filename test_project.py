@@ -1,6 +1,12 @@
 import pytest
 import csv
-from project import get_input_data, get_RRC_threshold,get_closest_neighbor_distance,analyze_and_update_data,Cell
+import sys
+import subprocess
+import os
+import shutil
+import numpy as np
+from benchmark import generate_network
+from project import get_input_data, get_RRC_threshold,get_closest_neighbor_distance,analyze_and_update_data,Cell,CellTable,State,tilt_decision_kernel,iter_cell_batches,load_cell_table,save_output_data,write_output,simulate_tilt,sweep_thresholds,main
 
 
 def test_get_input_data_correct_input(tmp_path,monkeypatch):
@@ -295,3 +301,326 @@ def test_analyze_and_update_data_low_RRC_Success_Rate_input():
 
     assert analyze_and_update_data(input_rows,neigh_dist,RRC_tresh) == expected_output
 
+
+
+def test_get_closest_neighbor_distance_small_batches():
+    input_rows = [                                                                              #same network as above, asked 4 neighbors at a time so most cells need more than one batch
+        Cell("CELL1",38.130399,-77.513747,0,27,26,0.31,60),
+        Cell("CELL2",38.130399,-77.513747,120,34,33,0.31,60),
+        Cell("CELL3",38.130399,-77.513747,240,29,28,0.31,60),
+        Cell("CELL4",38.194806,-77.501444,0,15,11,4.61,60),
+        Cell("CELL5",38.194806,-77.501444,120,19,14,4.61,60),
+        Cell("CELL6",38.194806,-77.501444,240,16,12,4.61,60),
+        Cell("CELL7",38.234058,-77.548414,0,1,0,0.54,10),
+        Cell("CELL8",38.234058,-77.548414,120,1,0,0.54,10),
+        Cell("CELL9",38.234058,-77.548414,240,1,0,0.54,10)
+    ]
+
+    assert get_closest_neighbor_distance(input_rows, k=4) == get_closest_neighbor_distance(input_rows, k=len(input_rows))
+
+
+def test_get_closest_neighbor_distance_vectorized_matches_scalar(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda _: os.path.join(os.path.dirname(__file__), "input.csv"))
+    cells = get_input_data()
+    vectorized = get_closest_neighbor_distance(cells)
+    scalar = get_closest_neighbor_distance(cells, vectorized=False)
+    assert [row["name"] for row in vectorized] == [row["name"] for row in scalar]
+    assert [row["dist"] for row in vectorized] == pytest.approx([row["dist"] for row in scalar])
+
+
+def test_get_closest_neighbor_distance_uneven_sites():
+    input_rows = [                                                                              #a 6 sector site and a 1 sector site, co-located sectors must never be taken as neighbors
+        Cell("CELL1",38.130399,-77.513747,0,27,26,0.31,60),
+        Cell("CELL2",38.130399,-77.513747,60,34,33,0.31,60),
+        Cell("CELL3",38.130399,-77.513747,120,29,28,0.31,60),
+        Cell("CELL4",38.130399,-77.513747,180,27,26,0.31,60),
+        Cell("CELL5",38.130399,-77.513747,240,34,33,0.31,60),
+        Cell("CELL6",38.130399,-77.513747,300,29,28,0.31,60),
+        Cell("CELL7",38.194806,-77.501444,180,15,11,4.61,60)
+    ]
+
+    expected_output = [
+        {'name': 'CELL1', 'dist': 2.0667344575744444},
+        {'name': 'CELL2', 'dist': 2.0667344575744444},
+        {'name': 'CELL3', 'dist': 0},
+        {'name': 'CELL4', 'dist': 0},
+        {'name': 'CELL5', 'dist': 0},
+        {'name': 'CELL6', 'dist': 0},
+        {'name': 'CELL7', 'dist': 2.0667344575744444}
+        ]
+
+    assert get_closest_neighbor_distance(input_rows) == expected_output
+
+
+def test_cell_table_matches_cells(monkeypatch):
+    input_file = os.path.join(os.path.dirname(__file__), "input.csv")
+    monkeypatch.setattr("builtins.input", lambda _: input_file)
+    cells = get_input_data()
+    table = CellTable.from_csv(input_file)                                                      #same file read into columns instead of Cell instances
+    assert list(table) == cells
+    neigh_dist = get_closest_neighbor_distance(table)
+    assert neigh_dist == get_closest_neighbor_distance(cells)
+    analyze_and_update_data(table,neigh_dist,90)
+    analyze_and_update_data(cells,neigh_dist,90)
+    assert table.tilt.tolist() == [cell.tilt for cell in cells]
+    assert table.state_names() == [cell.state for cell in cells]
+
+
+def test_cell_table_rows_are_snapshots():
+    table = CellTable.from_csv(os.path.join(os.path.dirname(__file__), "input.csv"))
+    cell = table[0]
+    cell.tilt = 40
+    cell.state = State.OVERSHOOTER_DOWNTILTED
+    for row in table:
+        row.tilt = 40
+    assert table.tilt[0] == 60 and table.state[0] == State.NO_ACTION                            #changing the Cell does not change the table
+    assert table[0] == Cell("CELL1",38.130399,-77.513747,0,27,26,0.31,60)
+    table.tilt[0] = 40                                                                          #the columns are changed instead
+    assert table[0].tilt == 40
+
+
+def test_cell_table_incorrect_RRC_Succ_input():
+    with pytest.raises(ValueError, match="RRC_Succ value cannot be greater than RRC_Att"):
+        CellTable(["CELL1","CELL2"],[37.4419,37.4539],[-122.143,-122.143],[0,120],[100,200],[80,280],[35,3],[40,60])
+
+
+def test_tilt_decision_kernel_limits():
+    RRC_Att = np.array([100,100,100,100,100])
+    RRC_Succ = np.array([80,80,80,80,99])
+    Timing_Advance = np.array([35,35,3,3,35])
+    tilt = np.array([90,40,10,0,40])
+    dist = np.array([10,10,100,100,10])
+
+    new_tilt, state = tilt_decision_kernel(RRC_Att,RRC_Succ,Timing_Advance,tilt,dist,95)
+
+    assert new_tilt.tolist() == [100,60,0,0,40]
+    assert state.tolist() == [State.OVERSHOOTER_DOWNTILTED_LESS,State.OVERSHOOTER_DOWNTILTED,
+                              State.UNDERSHOOTER_UPTILTED_LESS,State.TILT_CANNOT_BE_DECREASED,State.NO_ACTION]
+
+
+def test_iter_cell_batches_rejects(tmp_path):
+    csv_file = tmp_path / "input.csv"
+    reject_file = tmp_path / "rejects.csv"
+    input_rows = [                                                                              #lines 3 and 5 are bad, the other rows must still be loaded
+        ["CellName","Latitude","Longitude","Azimuth","RRC_Att","RRC_Succ","Timing_Advance","tilt"],
+        ["CELL1","37.4419","-122.143","0","100","80","35","40"],
+        ["CELL2","37.4539","-122.143","120","200","270","3","60"],
+        ["CELL3","37.4339","-122.131","240","100","80","35","40"],
+        ["CELL4","37.4479","-122.155","50","two hundred","170","3","60"],
+        ["CELL5","37.4479","-122.155","170","200","170","3","60"]
+    ]
+    with open(csv_file, "w", newline='', encoding="utf-8") as file:
+        csv.writer(file).writerows(input_rows)
+
+    batches = list(iter_cell_batches(str(csv_file), chunk_size=2, rejects=str(reject_file)))
+
+    assert [batch.CellName.tolist() for batch in batches] == [["CELL1"],["CELL3"],["CELL5"]]
+    with open(reject_file) as file:
+        rejects = list(csv.DictReader(file))
+    assert [(row["line"], row["CellName"]) for row in rejects] == [("3","CELL2"),("5","CELL4")]
+    assert rejects[0]["reason"] == "RRC_Succ value cannot be greater than RRC_Att"
+
+
+def test_load_cell_table_without_rejects(tmp_path):
+    csv_file = tmp_path / "input.csv"
+    with open(csv_file, "w", newline='', encoding="utf-8") as file:
+        csv.writer(file).writerows([
+            ["CellName","Latitude","Longitude","Azimuth","RRC_Att","RRC_Succ","Timing_Advance","tilt"],
+            ["CELL1","37.4419","-122.143","0","100","80","35","40"],
+            ["CELL2","37.4539","-122.143","120","200","170","3","160"]
+        ])
+    with pytest.raises(ValueError, match="line 3: Tilt value cannot be more than 100"):
+        load_cell_table(csv_file)
+
+
+def test_load_cell_table_blank_lines(tmp_path):
+    with open(os.path.join(os.path.dirname(__file__), "input.csv")) as file:
+        (tmp_path / "input.csv").write_text(file.read() + "\n")                             #trailing blank line
+    table = load_cell_table(tmp_path / "input.csv", rejects=tmp_path / "rejects.csv")
+    assert len(table) == 750
+    assert len((tmp_path / "rejects.csv").read_text().splitlines()) == 1                      #header only, a blank line is not a bad row
+    assert main([str(tmp_path / "input.csv"), "-t", "90", "-o", str(tmp_path / "out")]) == 0
+    (tmp_path / "short.csv").write_text("CellName,Latitude,Azimuth,RRC_Att,RRC_Succ,Timing_Advance,tilt\n")
+    with pytest.raises(ValueError, match="has no Longitude column"):
+        load_cell_table(tmp_path / "short.csv")
+
+
+def test_save_output_data_matches_output_csv(tmp_path):
+    folder = os.path.dirname(__file__)
+    table = load_cell_table(os.path.join(folder, "input.csv"))
+    analyze_and_update_data(table,get_closest_neighbor_distance(table),90)                     #output.csv in the repository was produced with a 90% threshold
+    save_output_data(table, tmp_path / "output.csv")
+    with open(tmp_path / "output.csv", "rb") as written, open(os.path.join(folder, "output.csv"), "rb") as expected:
+        assert written.read() == expected.read()
+
+
+def test_write_output_npz(tmp_path):
+    table = CellTable(["CELL1","CELL2"],[37.4419,37.4539],[-122.143,-122.143],[0,120],[100,200],[80,170],[35,3],[40,60],
+                      state=["No action","Undershooter, cell uptilted 20 degrees"])
+    write_output(table, tmp_path / "output.npz")
+    with np.load(tmp_path / "output.npz") as output:
+        assert output["CellName"].tolist() == ["CELL1","CELL2"]
+        assert output["tilt"].tolist() == [40,60]
+        assert [output["STATES"][code] for code in output["state"]] == ["No action","Undershooter, cell uptilted 20 degrees"]
+    with pytest.raises(ValueError):
+        write_output(table, tmp_path / "output.xlsx")
+
+
+def test_write_output_parquet(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")                                           #pyarrow is optional
+    table = CellTable(["CELL1","CELL2"],[37.4419,37.4539],[-122.143,-122.143],[0,120],[100,200],[80,170],[35,3],[40,60],
+                      state=["No action","Undershooter, cell uptilted 20 degrees"])
+    write_output(table, tmp_path / "output.parquet")
+    output = parquet.read_table(tmp_path / "output.parquet")
+    assert output.column_names == ["CellName","Latitude","Longitude","RRC_Att","RRC_Succ","Timing_Advance","tilt","state"]
+    assert output.column("CellName").to_pylist() == ["CELL1","CELL2"]
+    assert output.column("tilt").to_pylist() == [40,60]
+    assert str(output.schema.field("state").type) == "dictionary<values=string, indices=int8, ordered=0>"   #dictionary encoded, the state texts are stored once
+    assert output.column("state").chunk(0).dictionary.to_pylist()[2] == "Undershooter, cell uptilted 20 degrees"
+    assert output.column("state").to_pylist() == ["No action","Undershooter, cell uptilted 20 degrees"]
+
+
+def test_get_closest_neighbor_distance_parallel_tiles():
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    expected_output = get_closest_neighbor_distance(table)
+    assert get_closest_neighbor_distance(table, workers=2) == expected_output
+    assert get_closest_neighbor_distance(table, workers=2, margin_km=1) == expected_output  #small overlap, many cells are checked again over the whole network
+
+
+def test_simulate_tilt_one_round_matches_analysis():
+    input_file = os.path.join(os.path.dirname(__file__), "input.csv")
+    neigh_dist = get_closest_neighbor_distance(load_cell_table(input_file))
+    analyzed = analyze_and_update_data(load_cell_table(input_file),neigh_dist,90)
+    simulated, report = simulate_tilt(load_cell_table(input_file),neigh_dist,90,max_rounds=1)
+    assert simulated.tilt.tolist() == analyzed.tilt.tolist()
+    assert simulated.state.tolist() == analyzed.state.tolist()
+    assert report.rounds == 1 and not report.converged
+
+
+def test_simulate_tilt_converges():
+    input_file = os.path.join(os.path.dirname(__file__), "input.csv")
+    table = load_cell_table(input_file)
+    simulated, report = simulate_tilt(table,get_closest_neighbor_distance(table),90)
+    assert report.converged
+    assert report.changed[-1] == 0
+    assert report.evaluated[1:] == report.changed[:-1]                                          #only the cells changed in a round are analyzed in the next one
+    assert ((simulated.tilt >= 0) & (simulated.tilt <= 100)).all()
+
+
+def test_sweep_thresholds_matches_analysis():
+    input_file = os.path.join(os.path.dirname(__file__), "input.csv")
+    table = load_cell_table(input_file)
+    neigh_dist = get_closest_neighbor_distance(table)
+    thresholds = [50,75,90,100]
+
+    summary, new_tilts, states = sweep_thresholds(table,neigh_dist,thresholds,per_cell=True)
+
+    assert [row["threshold"] for row in summary] == thresholds
+    for column, RRC_tresh in enumerate(thresholds):                                             #every column must be the same as a full analysis with that threshold
+        analyzed = analyze_and_update_data(load_cell_table(input_file),neigh_dist,RRC_tresh)
+        assert new_tilts[:, column].tolist() == analyzed.tilt.tolist()
+        assert states[:, column].tolist() == analyzed.state.tolist()
+        assert summary[column]["overshooters"] == sum(name.startswith("Overshooter") for name in analyzed.state_names())
+
+
+def test_sweep_thresholds_factors():
+    table = CellTable(["CELL1"],[37.4419],[-122.143],[0],[100],[80],[35],[40])
+    summary = sweep_thresholds(table,[{"name": "CELL1", "dist": 36}],[95],over_factors=[1.0,1.1])
+    assert [(row["over_factor"], row["overshooters"], row["undershooters"]) for row in summary] == [(1.0,0,1),(1.1,1,0)]
+    with pytest.raises(ValueError, match="At least one threshold"):
+        sweep_thresholds(table,[{"name": "CELL1", "dist": 36}],[])
+    with pytest.raises(ValueError, match="At least one threshold"):
+        sweep_thresholds(table,[{"name": "CELL1", "dist": 36}],[95],under_factors=[])
+
+
+def test_load_cell_table_empty_file(tmp_path,capfd):
+    (tmp_path / "empty.csv").write_text("")
+    with pytest.raises(ValueError, match="is empty"):
+        load_cell_table(tmp_path / "empty.csv")
+    assert main([str(tmp_path / "empty.csv"), os.path.join(os.path.dirname(__file__), "input.csv"), "-t", "90", "-o", str(tmp_path / "out")]) == 1
+    assert os.listdir(tmp_path / "out") == ["input_output.csv"]                                 #an empty file does not stop the other files
+    _, err = capfd.readouterr()
+    assert "empty.csv" in err
+
+
+def test_main_batch(tmp_path,capfd):
+    regions = tmp_path / "regions"
+    regions.mkdir()
+    with open(os.path.join(os.path.dirname(__file__), "input.csv")) as file:
+        text = file.read()
+    (regions / "north.csv").write_text(text)
+    (regions / "south.csv").write_text(text)
+    (regions / "broken.txt").write_text("no cells here")
+
+    assert main([str(regions / "*.csv"), "--threshold", "90%", "--output-dir", str(tmp_path / "out")]) == 0
+    assert sorted(os.listdir(tmp_path / "out")) == ["north_output.csv","south_output.csv"]
+    with open(tmp_path / "out" / "north_output.csv") as written, open(os.path.join(os.path.dirname(__file__), "output.csv")) as expected:
+        assert written.read() == expected.read()
+
+    assert main([str(regions / "north.csv"), str(regions / "broken.txt"), "-t", "90", "-o", str(tmp_path / "out")]) == 1
+    _, err = capfd.readouterr()
+    assert "Could not process" in err and "broken.txt" in err
+
+
+def test_main_batch_same_file_names(tmp_path,capfd):
+    for region in ("north", "south"):
+        (tmp_path / region).mkdir()
+        shutil.copy(os.path.join(os.path.dirname(__file__), "input.csv"), tmp_path / region / "cells.csv")
+    assert main([str(tmp_path / "*" / "cells.csv"), "-t", "90", "-o", str(tmp_path / "out")]) == 1
+    assert os.listdir(tmp_path / "out") == ["cells_output.csv"]                                 #the second file is not written over the first one
+    _, err = capfd.readouterr()
+    assert "Could not process" in err and os.path.join("south", "cells.csv") in err
+
+
+def test_main_batch_incorrect_arguments():
+    with pytest.raises(SystemExit) as exit_info:
+        main(["input.csv"])                                                                     #threshold is required with input files
+    assert exit_info.value.code == 2
+    with pytest.raises(SystemExit):
+        main(["input.csv", "--threshold", "95percent"])
+    with pytest.raises(SystemExit) as exit_info:
+        main(["input.csv", "-t", "90", "--profile", "write_output=perf"])                      #unknown profiler
+    assert exit_info.value.code == 2
+
+
+def test_get_closest_neighbor_distance_scikit_learn(monkeypatch):
+    table = load_cell_table(os.path.join(os.path.dirname(__file__), "input.csv"))
+    expected_output = get_closest_neighbor_distance(table)                                      #small network, numPy distances
+    monkeypatch.setattr("project.BRUTE_FORCE_SITES", 0)
+    assert get_closest_neighbor_distance(table) == expected_output                             #same network through the scikit-learn BallTree
+
+
+def test_get_closest_neighbor_distance_full_scan(monkeypatch):
+    table = generate_network(6000, seed=6)
+    monkeypatch.setattr("project.FULL_SCAN_FRACTION", 1)                                        #k doubles up to every site
+    expected_output = get_closest_neighbor_distance(table)
+    assert any(dist["dist"] == 0 for dist in expected_output)                                  #some cells have nothing in front
+    monkeypatch.setattr("project.FULL_SCAN_FRACTION", 0)                                        #every site is scanned after the first batch
+    assert get_closest_neighbor_distance(table) == expected_output
+
+
+def test_import_is_light():
+    code = "import sys, project; project.Cell('CELL1',37.4419,-122.143,0,100,80,35,40); print('numpy' in sys.modules, 'sklearn' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.split() == ["False","False"]
+
+
+def test_cell_from_validated_and_state_codes():
+    cell = Cell.from_validated("CELL1",37.4419,-122.143,0,100,80,35,40)
+    assert cell == Cell("CELL1",37.4419,-122.143,0,100,80,35,40)
+    assert not hasattr(cell, "__dict__")                                                        #values are kept in slots
+    cell.state = "Overshooter, cell downtilted 20 degrees"
+    assert cell.state_code == State.OVERSHOOTER_DOWNTILTED
+    cell.state = State.TILT_CANNOT_BE_DECREASED
+    assert cell.state == "Tilt value cannot be decreased further"
+    with pytest.raises(ValueError):
+        cell.state = "Downtilted a lot"
+    with pytest.raises(ValueError):
+        cell.state = 42
+    for not_a_code in (True, 1.0):                                                              #equal to State 1, but not State codes
+        with pytest.raises(ValueError):
+            cell.state = not_a_code
+    assert cell.state_code == State.TILT_CANNOT_BE_DECREASED
+    table = CellTable(["CELL1"],[37.4419],[-122.143],[0],[100],[80],[35],[40],state=["Undershooter, cell uptilted 20 degrees"])
+    cell.state = table.state[0]                                                                 #numPy int8 code
+    assert cell.state_code == State.UNDERSHOOTER_UPTILTED
@@ -0,0 +1,72 @@
+import asyncio
+import os
+from project import OUTPUT_FIELDS
+from service import MAX_BATCH_ROWS, OptimizerService
+
+INPUT = os.path.join(os.path.dirname(__file__), "input.csv")
+
+
+async def send_batches(service, lines):
+    server = await asyncio.start_server(service.handle, "127.0.0.1", 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(b"".join((line if isinstance(line, bytes) else line.encode()) + b"\n" for line in lines))
+        writer.write_eof()
+        lines = (await reader.read()).decode().split("\n")
+        writer.close()
+    answers = [[]]
+    for line in lines[1:-1]:                                                                    #header line first, then the rows of every batch closed by an empty line
+        if line:
+            answers[-1].append(line)
+        else:
+            answers.append([])
+    return lines[0], answers[:-1]
+
+
+def test_service_streams_decisions():
+    service = OptimizerService.from_csv(INPUT, 90)
+    header, answers = asyncio.run(send_batches(service, [
+        "CellName,RRC_Att,RRC_Succ,Timing_Advance",
+        "CELL1,100,50,0.31", "CELL5,19,19,4.61", "",
+        "CELL9999,100,50,0.31", "",
+        "CELL1,100,50,0.31",
+    ]))
+
+    assert header == ",".join(OUTPUT_FIELDS)
+    assert [row.split(",")[0] for row in answers[0]] == ["CELL1","CELL5"]                       #same decisions as IncrementalOptimizer.apply_delta
+    assert [row.split(",")[6] for row in answers[0]] == ["40","40"]
+    assert answers[1][0].startswith("ERROR,\"CELL9999")                                         #a bad batch does not close the connection
+    assert [row.split(",")[6] for row in answers[2]] == ["20"]                                  #resident state is kept, CELL1 is uptilted once more from 40
+    assert service.batches == 3 and service.decisions == 3
+
+
+def test_service_splits_large_batches():
+    service = OptimizerService.from_csv(INPUT, 90)
+    rows = ["CELL2,10,10,0.5"] * (2 * MAX_BATCH_ROWS + 1)
+    header, answers = asyncio.run(send_batches(service, ["CellName,RRC_Att,RRC_Succ,Timing_Advance"] + rows))
+    assert len(answers) == 3 and service.batches == 3
+
+
+def test_service_short_row():
+    service = OptimizerService.from_csv(INPUT, 90)
+    header, answers = asyncio.run(asyncio.wait_for(send_batches(service, [
+        "CellName,RRC_Att,RRC_Succ,Timing_Advance",
+        "CELL1,100", "",
+        "CELL1,100,50,0.31",
+    ]), timeout=5))
+    assert answers[0][0].startswith("ERROR")                                                    #a short row is answered with an error, not a stalled connection
+    assert [row.split(",")[0] for row in answers[1]] == ["CELL1"]
+
+
+def test_service_not_utf8():
+    service = OptimizerService.from_csv(INPUT, 90)
+    header, answers = asyncio.run(asyncio.wait_for(send_batches(service, [
+        "CellName,RRC_Att,RRC_Succ,Timing_Advance",
+        "CELL1,100,50,0.31", b"CELL\xff,100,50,0.31", "",
+        "CELL1,100,50,0.31",
+    ]), timeout=5))
+    assert header == ",".join(OUTPUT_FIELDS)
+    assert answers[0][0].startswith("ERROR") and "utf-8" in answers[0][0]                      #the batch with the bad line is answered with an error
+    assert [row.split(",")[0] for row in answers[1]] == ["CELL1"]                               #the connection stays open
+    header, answers = asyncio.run(asyncio.wait_for(send_batches(service, [b"CellName,RRC_Att,\xff"]), timeout=5))
+    assert header.startswith("ERROR,\"First line should be the header")                       #a header which is not UTF-8 is a wrong header
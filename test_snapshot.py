@@ -0,0 +1,32 @@
+import csv
+import filecmp
+import os
+import numpy as np
+import pytest
+from project import analyze_and_update_data, get_closest_neighbor_distance, load_cell_table, save_output_data
+from snapshot import csv_to_snapshot, geometry_hash, open_snapshot, read_header, snapshot_to_csv
+
+INPUT = os.path.join(os.path.dirname(__file__), "input.csv")
+
+
+def test_snapshot_round_trip(tmp_path):
+    csv_to_snapshot(INPUT, str(tmp_path / "network.snap"))
+    table = open_snapshot(str(tmp_path / "network.snap"))
+
+    assert all(isinstance(getattr(table, field).base, np.memmap) for field in ("Latitude", "RRC_Att", "tilt", "state"))   #columns are mapped, not copied
+    assert read_header(str(tmp_path / "network.snap"))["geometry_hash"] == geometry_hash(load_cell_table(INPUT))
+
+    analyze_and_update_data(table, get_closest_neighbor_distance(table), 90)
+    save_output_data(table, str(tmp_path / "output.csv"))
+    assert filecmp.cmp(str(tmp_path / "output.csv"), os.path.join(os.path.dirname(__file__), "output.csv"), shallow=False)
+    assert open_snapshot(str(tmp_path / "network.snap")).tilt.tolist() == load_cell_table(INPUT).tilt.tolist()   #copy on write, analysis does not change the file
+
+    snapshot_to_csv(str(tmp_path / "network.snap"), str(tmp_path / "inventory.csv"))
+    with open(tmp_path / "inventory.csv") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["CellName"] for row in rows] == table.CellName.tolist() and set(rows[0]) == {"CellName", "Latitude", "Longitude", "RRC_Att", "RRC_Succ", "Timing_Advance", "tilt", "state"}
+
+
+def test_snapshot_not_a_snapshot():
+    with pytest.raises(ValueError):
+        open_snapshot(INPUT)